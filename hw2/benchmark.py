@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from scoring import confusion_matrix
+from util import LANGUAGES, get_char_ngrams, load_data
+from model import NBLangIDModel
+
+
+# characters used to make up words for each synthetic language
+ALPHABETS = {
+    "eng": "abcdefghijklmnopqrstuvwxyz",
+    "rus": "абвгдеёжзийклмнопрстуфхцчшщъыьэюя",
+    "ita": "abcdefghilmnopqrstuvzàèìòù",
+    "spa": "abcdefghijlmnopqrstuvñáéíóú",
+    "fra": "abcdefghijlmnopqrstuvxyzéèàçê",
+    "tur": "abcçdefgğhıijklmnoöprsştuüvyz",
+    "deu": "abcdefghiklmnopqrstuvwzäöüß",
+    "cmn": "的一是不了人我在有他这中大来上国个到说们为子和你地出道也时年得就那要下以生会自着去",
+}
+
+ENGINES = {
+    "dict": {},
+    "vectorized": {"vectorized": True},
+    "hashed": {"hash_buckets": 2 ** 18},
+}
+
+
+def write_corpus(filename: str, num_sentences: int, seed: int = 457, vocab_size: int = 500):
+    """
+    Write a synthetic multilingual corpus in the .tsv format read by load_data.
+    Each language gets a random vocabulary of words over its own alphabet;
+    cmn sentences are written without spaces.
+
+    Args:
+        filename (str): the file to write
+        num_sentences (int): number of sentences
+        seed (int, optional): random seed. Defaults to 457.
+        vocab_size (int, optional): number of words per language. Defaults to 500.
+    """
+    rng = random.Random(seed)
+    words = {}
+    for lang in LANGUAGES:
+        max_length = 3 if lang == "cmn" else 9
+        words[lang] = ["".join(rng.choice(ALPHABETS[lang]) for _ in range(rng.randint(1, max_length)))
+                       for _ in range(vocab_size)]
+    with open(filename, "w") as f:
+        f.write("sentence\tlang\n")
+        for _ in range(num_sentences):
+            lang = rng.choice(LANGUAGES)
+            separator = "" if lang == "cmn" else " "
+            sentence = separator.join(rng.choice(words[lang]) for _ in range(rng.randint(1, 15)))
+            f.write(f"{sentence}\t{lang}\n")
+
+
+def measure(stage: Callable[[], Any], memory: bool) -> Tuple[Any, float, Optional[int]]:
+    """
+    Run one stage of the pipeline, measuring wall time and (optionally) the
+    peak memory allocated while it runs
+
+    Args:
+        stage (Callable[[], Any]): the stage to run
+        memory (bool): trace allocations (this slows the stage down)
+
+    Returns:
+        Tuple[Any, float, Optional[int]]: the result of the stage, the time in
+            seconds and the peak number of bytes allocated (None if not traced)
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = stage()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run(sizes: List[int], ngram_sizes: List[int], engines: List[str], memory: bool) \
+    -> List[Dict[str, Any]]:
+    """
+    Benchmark every stage for every corpus size, n-gram size and engine
+
+    Args:
+        sizes (List[int]): number of sentences in the train and test sets
+        ngram_sizes (List[int]): n-gram sizes to try
+        engines (List[str]): keys of ENGINES to try
+        memory (bool): also record peak memory
+
+    Returns:
+        List[Dict[str, Any]]: one result per (size, n-gram size, engine, stage)
+    """
+    results = []
+
+    def record(size: int, ngram_size: Optional[int], engine: Optional[str], stage: str,
+               seconds: float, peak: Optional[int], num_sentences: int):
+        results.append({
+            "size": size, "ngram_size": ngram_size, "engine": engine, "stage": stage,
+            "seconds": seconds, "sentences_per_sec": num_sentences / seconds if seconds > 0 else None,
+            "peak_bytes": peak,
+        })
+        print(f"{size:>8} {str(ngram_size):>5} {str(engine):>10} {stage:>16} "
+              f"{seconds:9.3f}s {results[-1]['sentences_per_sec'] or 0:12.0f}/s "
+              f"{'' if peak is None else f'{peak / 2 ** 20:9.1f} MiB'}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            train_path = os.path.join(directory, f"train_{size}.tsv")
+            test_path = os.path.join(directory, f"test_{size}.tsv")
+            write_corpus(train_path, size, seed=size)
+            write_corpus(test_path, size, seed=size + 1)
+
+            (train_sentences, train_labels), seconds, peak = measure(lambda: load_data(train_path), memory)
+            record(size, None, None, "load_data", seconds, peak, size)
+            test_sentences, test_labels = load_data(test_path)
+
+            for ngram_size in ngram_sizes:
+                _, seconds, peak = measure(
+                    lambda: [get_char_ngrams(sentence, ngram_size) for sentence in train_sentences], memory)
+                record(size, ngram_size, None, "get_char_ngrams", seconds, peak, size)
+
+                for engine in engines:
+                    model = NBLangIDModel(ngram_size=ngram_size, **ENGINES[engine])
+                    # the priors and likelihoods are computed lazily, so predict
+                    # on an empty list to include them in the fit stage
+                    _, seconds, peak = measure(
+                        lambda: (model.fit(train_sentences, train_labels), model.predict([])), memory)
+                    record(size, ngram_size, engine, "fit", seconds, peak, size)
+
+                    predictions, seconds, peak = measure(lambda: model.predict(test_sentences), memory)
+                    record(size, ngram_size, engine, "predict", seconds, peak, size)
+
+                    _, seconds, peak = measure(
+                        lambda: confusion_matrix(test_labels, predictions, LANGUAGES), memory)
+                    record(size, ngram_size, engine, "confusion_matrix", seconds, peak, size)
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]]):
+    """
+    Print the speedup of each result over the matching result of an earlier run
+
+    Args:
+        results (List[Dict[str, Any]]): results of this run
+        baseline (List[Dict[str, Any]]): results of the earlier run
+    """
+    def key(result: Dict[str, Any]) -> Tuple:
+        return result["size"], result["ngram_size"], result["engine"], result["stage"]
+
+    baseline_seconds = {key(result): result["seconds"] for result in baseline}
+    print()
+    print("Speedup over baseline")
+    for result in results:
+        if key(result) in baseline_seconds and result["seconds"] > 0:
+            size, ngram_size, engine, stage = key(result)
+            print(f"{size:>8} {str(ngram_size):>5} {str(engine):>10} {stage:>16} "
+                  f"{baseline_seconds[key(result)] / result['seconds']:8.2f}x")
+
+
+def main():
+    """
+    Benchmark the language ID pipeline on synthetic corpora. For example:
+        python benchmark.py --sizes 1000 10000 --output results.json
+        python benchmark.py --sizes 1000 10000 --compare results.json
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=[1000, 10000, 100000],
+        type=int,
+        help="Number of sentences in each synthetic train (and test) set")
+    parser.add_argument(
+        "--ngram_sizes",
+        nargs="+",
+        default=[2, 3],
+        type=int,
+        help="The sizes of character n-grams to use")
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        default=list(ENGINES),
+        choices=list(ENGINES),
+        help="Which NBLangIDModel configurations to run")
+    parser.add_argument(
+        "--no_memory",
+        action="store_true",
+        help="Do not trace peak memory (tracing slows every stage down)")
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="Write the results to this JSON file")
+    parser.add_argument(
+        "--compare",
+        type=str,
+        help="A JSON file from an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.ngram_sizes, args.engines, memory=not args.no_memory)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "memory_traced": not args.no_memory,
+                "results": results,
+            }, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+
+import numpy as np
+
+from scoring import accuracy_score
+from util import get_char_ngram_ids, load_data
+from model import NBLangIDModel, hash_ngram_ids
+
+
+def main():
+    """
+    Compare a hashed n-gram model with the exact model: how many n-grams share
+    a bucket, how much memory the counts take and how accuracy changes. Run:
+        python hash_report.py data/train.tsv data/test.tsv --hash_buckets 65536
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "train_file_path",
+        type=str,
+        help="The file to use for training")
+    parser.add_argument(
+        "test_file_path",
+        type=str,
+        help="The file to use for testing")
+    parser.add_argument(
+        "--avg_samples_per_language",
+        type=int,
+        help="The number of samples to use per language. If not given, loads the full dataset.")
+    parser.add_argument(
+        "--ngram_size",
+        default=2,
+        type=int,
+        help="The size of character n-grams to use")
+    parser.add_argument(
+        "--hash_buckets",
+        nargs="+",
+        default=[2 ** 16],
+        type=int,
+        help="One or more bucket counts to compare with the exact model")
+    args = parser.parse_args()
+
+    train_sentences, train_labels = load_data(
+        args.train_file_path, avg_samples_per_language=args.avg_samples_per_language)
+    test_sentences, test_labels = load_data(
+        args.test_file_path, avg_samples_per_language=args.avg_samples_per_language)
+
+    exact_model = NBLangIDModel(ngram_size=args.ngram_size, vectorized=True)
+    exact_model.fit(train_sentences, train_labels)
+    exact_predictions = exact_model.predict(test_sentences)
+    vocab = exact_model.ngram_vocab()
+
+    print(f"Exact model: {exact_model.vocab_size} distinct n-grams, "
+          f"{exact_model.count_table_entries()} (language, n-gram) counts, "
+          f"about {exact_model.count_table_bytes()} count bytes")
+    print("Accuracy: {0:.2%}".format(accuracy_score(test_labels, exact_predictions)))
+    print()
+
+    header = ["buckets", "occupied", "collision rate", "count bytes", "accuracy", "agreement"]
+    print(" | ".join(header))
+    print(" | ".join("-" * len(column) for column in header))
+    for hash_buckets in args.hash_buckets:
+        model = NBLangIDModel(ngram_size=args.ngram_size, hash_buckets=hash_buckets)
+        model.fit(train_sentences, train_labels)
+        predictions = model.predict(test_sentences)
+
+        # an n-gram collides if it shares its bucket with any other n-gram
+        vocab_buckets = hash_ngram_ids(get_char_ngram_ids(vocab, args.ngram_size)[0], hash_buckets)
+        bucket_sizes = np.bincount(vocab_buckets, minlength=hash_buckets)
+        collision_rate = bucket_sizes[bucket_sizes > 1].sum() / len(vocab)
+        count_bytes = model.count_table_bytes()
+        agreement = accuracy_score(exact_predictions, predictions)
+
+        print(" | ".join([
+            str(hash_buckets),
+            str(np.count_nonzero(bucket_sizes)),
+            "{0:.2%}".format(collision_rate),
+            str(count_bytes),
+            "{0:.2%}".format(accuracy_score(test_labels, predictions)),
+            "{0:.2%}".format(agreement),
+        ]))
+
+
+if __name__ == "__main__":
+    main()
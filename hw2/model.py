@@ -1,72 +1,774 @@
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
 from util import *
 from collections import defaultdict, Counter
+import multiprocessing
+import multiprocessing.pool
+import os
+import sys
+
+import numpy as np
+
+
+# number of sentences scored together by the vectorized predict path
+VECTORIZED_BATCH_SIZE = 4096
+
+# bump when the layout of saved models (or the n-gram hash) changes
+MODEL_FORMAT_VERSION = 4
+
+# temperatures tried by NBLangIDModel.calibrate, in increasing order; naive
+# Bayes posteriors are overconfident, so they are only ever softened
+CALIBRATION_TEMPERATURES = np.logspace(0, 3, 61)
+
+
+def hash_ngram_ids(ngram_ids: np.ndarray, hash_buckets: int) -> np.ndarray:
+    """
+    Map n-gram IDs (from get_char_ngram_ids) to buckets. The IDs are mixed
+    with the splitmix64 finalizer first, since their low bits only depend on
+    the last character. Unlike the built-in hash, this is stable across processes.
+
+    Args:
+        ngram_ids (np.ndarray): the n-gram IDs
+        hash_buckets (int): the number of buckets
+
+    Returns:
+        np.ndarray: the bucket of each n-gram
+    """
+    hashes = ngram_ids ^ (ngram_ids >> np.uint64(30))
+    hashes *= np.uint64(0xBF58476D1CE4E5B9)
+    hashes ^= hashes >> np.uint64(27)
+    hashes *= np.uint64(0x94D049BB133111EB)
+    hashes ^= hashes >> np.uint64(31)
+    return (hashes % np.uint64(hash_buckets)).astype(np.int64)
+
+
+def _count_ngrams(shard: Tuple[List[str], List[str], int, bool, Optional[int]]) \
+    -> Dict[str, Union[Counter, np.ndarray]]:
+    """
+    Count the character n-grams of each language in one shard of the training
+    data. Defined at module level so that worker processes can run it.
+
+    Args:
+        shard (Tuple[List[str], List[str], int, bool, Optional[int]]): the
+            sentences, their labels, the n-gram size, whether to lowercase the
+            sentences and the number of hash buckets (None to count exact n-grams)
+
+    Returns:
+        Dict[str, Union[Counter, np.ndarray]]: mapping of language --> n-gram
+            counts, or of language --> counts per hash bucket
+    """
+    sentences, labels, ngram_size, lowercase, hash_buckets = shard
+    if hash_buckets is not None:
+        # a batch at a time, so the n-gram ID arrays stay small
+        bucket_counts = {}
+        for start in range(0, len(sentences), VECTORIZED_BATCH_SIZE):
+            lang_sentences = defaultdict(list)
+            for sent, lang in zip(sentences[start:start + VECTORIZED_BATCH_SIZE],
+                                  labels[start:start + VECTORIZED_BATCH_SIZE]):
+                lang_sentences[lang].append(sent.lower() if lowercase else sent)
+            for lang, sents in lang_sentences.items():
+                counts = np.bincount(hash_ngram_ids(get_char_ngram_ids(sents, ngram_size)[0], hash_buckets),
+                                     minlength=hash_buckets)
+                if lang in bucket_counts:
+                    bucket_counts[lang] += counts
+                else:
+                    bucket_counts[lang] = counts
+        return bucket_counts
+
+    ngram_counts = defaultdict(Counter)
+    for sent, lang in zip(sentences, labels):
+        sentence = sent.lower() if lowercase else sent
+        ngram_counts[lang].update(get_char_ngrams(sentence, ngram_size))
+    return dict(ngram_counts)
+
+
+def _log_softmax(scores: np.ndarray) -> np.ndarray:
+    """
+    Normalize log scores over the last axis (log-sum-exp) into log probabilities
+
+    Args:
+        scores (np.ndarray): unnormalized log scores
+
+    Returns:
+        np.ndarray: log probabilities
+    """
+    max_scores = scores.max(axis=-1, keepdims=True)
+    return scores - max_scores - np.log(np.exp(scores - max_scores).sum(axis=-1, keepdims=True))
+
+
+def _smooth_likelihoods(ngram_counts: Dict[str, Counter], vocab: Set[str], k: float) \
+    -> Tuple[Dict[str, Dict[str, float]], Dict[str, float]]:
+    """
+    Compute add-k smoothed likelihoods from sparse n-gram counts
+
+    Args:
+        ngram_counts (Dict[str, Counter]): mapping of language --> n-gram counts
+        vocab (Set[str]): every n-gram seen in training (used for smoothing)
+        k (float): the k value for add-k smoothing
+
+    Returns:
+        Tuple[Dict[str, Dict[str, float]], Dict[str, float]]: the likelihoods of the
+            n-grams seen with each language, and the likelihood of any other n-gram
+            in the vocab for each language
+    """
+    likelihoods = {}
+    unseen_likelihoods = {}
+    V = len(vocab)
+    for lang, counts in ngram_counts.items():
+        total_count = sum(counts.values())
+        likelihoods[lang] = {ngram: (count + k) / (total_count + V * k) for ngram, count in counts.items()}
+        unseen_likelihoods[lang] = (0 + k) / (total_count + V * k)
+    return likelihoods, unseen_likelihoods
 
 
 class NBLangIDModel:
-    def __init__(self, ngram_size: int = 2, extension: bool = False):
+    def __init__(self, ngram_size: int = 2, extension: bool = False,
+                 vectorized: bool = False, n_jobs: int = 1,
+                 hash_buckets: Optional[int] = None, k: Optional[float] = None,
+                 equal_priors: bool = False):
         """
         NBLangIDModel constructor
 
         Args:
             ngram_size (int, optional): size of char n-grams. Defaults to 2.
             extension (bool, optional): set to True to use extension code. Defaults to False.
+            vectorized (bool, optional): set to True to score sentences in batches with
+                NumPy instead of looping through the likelihood dicts. Defaults to False.
+            n_jobs (int, optional): number of worker processes used to count n-grams
+                during training, -1 uses every core. Defaults to 1.
+            hash_buckets (Optional[int], optional): if given, hash n-grams into this many
+                buckets and keep the counts in fixed size arrays, so memory does not grow
+                with the corpus. Hashed models always predict with the vectorized path.
+                Defaults to None (exact n-grams).
+            k (Optional[float], optional): the k value for add-k smoothing. Defaults to
+                None (.05 with the extension, 1 otherwise).
+            equal_priors (bool, optional): use a uniform prior over languages instead of
+                the label frequencies. Defaults to False.
         """
         self._priors = None
         self._likelihoods = None
         self.ngram_size = ngram_size
         self.extension = extension
+        self.vectorized = vectorized
+        assert n_jobs >= 1 or n_jobs == -1, "n_jobs must be at least 1, or -1 for all cores"
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.hash_buckets = hash_buckets
+        self.k = k
+        self.equal_priors = equal_priors
+        # default temperature of predict_stream, fitted by calibrate
+        self.stream_temperature = 1.0
+
+        # sparse training counts (or counts per hash bucket), updated by fit
+        # and partial_fit
+        self._vocab = None
+        self._ngram_counts = None
+        self._label_counts = None
+        self._unseen_likelihoods = None
+
+        # matrix mode parameters, only built when vectorized is True or
+        # n-grams are hashed (then there is no n-gram index)
+        self._langs = None
+        self._ngram_index = None
+        # integer IDs of the indexed n-grams, when they are exact (see _index_ngrams)
+        self._ngram_index_ids = None
+        self._log_prior_vector = None
+        self._log_likelihood_matrix = None
 
     def fit(self, train_sentences: List[str], train_labels: List[str]):
         """
-        Train the Naive Bayes model (by setting self._priors and self._likelihoods)
+        Train the Naive Bayes model from scratch. The priors and likelihoods
+        (self._priors and self._likelihoods) are computed lazily, the first
+        time the model is used for prediction
 
         Args:
             train_sentences (List[str]): sentences from the training data
             train_labels (List[str]): labels from the training data
         """
-        self._priors = defaultdict(dict)
-        vocab = set()
-        n_gram_counts = defaultdict(Counter)
+        self._reset_counts()
+        self.partial_fit(train_sentences, train_labels)
 
-        # Collect vocab and n-gram counts
-        for sent, lang in zip(train_sentences, train_labels):
-            sentence = sent.lower() if self.extension else sent # lowercase if extension is True
-            ngrams = get_char_ngrams(sentence, self.ngram_size)
-            vocab.update(ngrams)
-            n_gram_counts[lang].update(ngrams)
+    def _reset_counts(self):
+        """
+        Start from empty training counts
+        """
+        self._vocab = set()
+        self._ngram_counts = defaultdict(Counter) if self.hash_buckets is None else {}
+        self._label_counts = Counter()
+
+    def partial_fit(self, train_sentences: List[str], train_labels: List[str],
+                    pool: Optional[multiprocessing.pool.Pool] = None):
+        """
+        Update the n-gram and label counts with more training data, without
+        retraining from scratch. Only n-grams that were actually seen are
+        stored for each language, so the data can be streamed in chunks.
+
+        Args:
+            train_sentences (List[str]): sentences from the training data
+            train_labels (List[str]): labels from the training data
+            pool (Optional[multiprocessing.pool.Pool], optional): worker pool
+                that counts the shards when n_jobs > 1. Pass the same pool to
+                every call when streaming chunks; otherwise each call starts
+                (and stops) its own pool of n_jobs processes. Defaults to None.
+        """
+        assert not self._is_loaded(), "Cannot update a model loaded from a file, use fit instead"
+        if self._ngram_counts is None:
+            self._reset_counts()
+
+        # Collect vocab and n-gram counts, in n_jobs contiguous shards
+        # (lowercase if extension is True)
+        shard_size = max(1, math.ceil(len(train_sentences) / self.n_jobs))
+        shards = [(train_sentences[start:start + shard_size], train_labels[start:start + shard_size],
+                   self.ngram_size, self.extension, self.hash_buckets)
+                  for start in range(0, len(train_sentences), shard_size)]
+        if len(shards) > 1 and pool is not None:
+            shard_counts = pool.map(_count_ngrams, shards)
+        elif len(shards) > 1:
+            with multiprocessing.Pool(len(shards)) as pool:
+                shard_counts = pool.map(_count_ngrams, shards)
+        else:
+            shard_counts = [_count_ngrams(shard) for shard in shards]
+
+        # merging the shards in order gives the same counts as a single pass
+        for ngram_counts in shard_counts:
+            for lang, counts in ngram_counts.items():
+                if self.hash_buckets is None:
+                    self._vocab.update(counts)
+                    self._ngram_counts[lang].update(counts)
+                elif lang in self._ngram_counts:
+                    self._ngram_counts[lang] += counts
+                else:
+                    self._ngram_counts[lang] = counts
+        self._label_counts.update(train_labels)
+
+        # priors and likelihoods are out of date until the next prediction
+        self._priors = None
 
-        # Ensure all languages have all n-grams in vocab with at least zero count
-        for lang in n_gram_counts.keys():
-            n_gram_counts[lang].update({ngram: 0 for ngram in vocab if ngram not in n_gram_counts[lang]})
+    def _update_params(self):
+        """
+        Compute the priors and the add-k smoothed likelihoods from the counts.
+        Every language is smoothed over the whole vocab, but only the n-grams
+        seen with a language are stored in self._likelihoods; the likelihood
+        of any other n-gram in the vocab is self._unseen_likelihoods[lang].
+        """
+        assert self._ngram_counts is not None, "Cannot predict without a model!"
+        self._update_priors()
+
+        # Come up with the likelihoods
+        k = self._smoothing_k()
+        if self.hash_buckets is not None:
+            self._build_hashed_matrices(k)
+            return
+        self._likelihoods, self._unseen_likelihoods = _smooth_likelihoods(self._ngram_counts, self._vocab, k)
 
-        # print("vocab=", vocab)
-        # print("n_gram_counts=", n_gram_counts)
+        if self.vectorized:
+            self._build_matrices(k)
+        else:
+            # save builds these on demand; drop any built from older counts
+            self._index_ngrams(None)
+            self._log_likelihood_matrix = None
 
+    def _update_priors(self):
+        """
+        Compute the priors from the label counts
+        """
         # Come up with the priors
-        equal_priors = False
-        langCounts = Counter(train_labels)
-        self._priors = {lang: 1/len(langCounts) for lang in langCounts.keys()} if equal_priors else normalize(langCounts, log_prob=False)
+        langCounts = self._label_counts
+        self._priors = {lang: 1/len(langCounts) for lang in langCounts.keys()} if self.equal_priors else normalize(langCounts, log_prob=False)
 
-        # # make priors the same i.e, 1/num_langs
-        # self._priors = {lang: 1/len(langCounts) for lang in langCounts.keys()}
-        # print("my priors=", self._priors)
+        # language order and log priors used by the NumPy code paths
+        self._langs = list(self._priors.keys())
+        self._log_prior_vector = np.array([math.log(self._priors[lang]) for lang in self._langs])
 
-        # for lang in langCounts.keys():
-        #     self._priors[lang] = langCounts[lang] / len(train_labels)
-        # print("my priors=", self._priors)
+    def _smoothing_k(self) -> float:
+        """
+        Returns:
+            float: the k value for add-k smoothing
+        """
+        if self.k is not None:
+            return self.k
+        return .05 if self.extension else 1
 
-        # Come up with the likelihoods
-        self._likelihoods = defaultdict(Counter)
-        V = len(vocab)
-        k = .05 if self.extension else 1
-        # for lang in n_gram_counts.keys():
-        #     for ngram in n_gram_counts[lang].keys():
-        #         self._likelihoods[lang][ngram] = (n_gram_counts[lang][ngram]+k) / (sum(n_gram_counts[lang].values())+ (V*k))
-        for lang, counts in n_gram_counts.items():
-            total_count = sum(counts.values())
-            self._likelihoods[lang] = {ngram: (count + k) / (total_count + V * k) for ngram, count in counts.items()}
-        # print("likelihoods=", self._likelihoods)        
+    def set_smoothing(self, k: Optional[float] = None, equal_priors: bool = False):
+        """
+        Change the smoothing k and the priors without recounting n-grams; the
+        priors and likelihoods are recomputed from the stored counts on the
+        next prediction
+
+        Args:
+            k (Optional[float], optional): the k value for add-k smoothing. Defaults to
+                None (.05 with the extension, 1 otherwise).
+            equal_priors (bool, optional): use a uniform prior over languages. Defaults to False.
+        """
+        assert not self._is_loaded(), "Cannot change the smoothing of a model loaded from a file"
+        self.k = k
+        self.equal_priors = equal_priors
+        self._priors = None
+
+    def _check_params(self):
+        """
+        Make sure the priors and likelihoods reflect all of the training data
+        """
+        if self._is_loaded():
+            return
+        if self._priors is None:
+            self._update_params()
+
+    @property
+    def vocab_size(self) -> int:
+        """
+        Returns:
+            int: the number of distinct n-grams seen in training, or of
+                occupied buckets if n-grams are hashed
+        """
+        assert self._ngram_counts is not None, "The model has no training counts"
+        if self.hash_buckets is not None:
+            return int(np.count_nonzero(np.any([counts for counts in self._ngram_counts.values()], axis=0)))
+        return len(self._vocab)
+
+    def ngram_vocab(self) -> List[str]:
+        """
+        Returns:
+            List[str]: the n-grams seen in training, sorted (exact models only)
+        """
+        assert self._vocab is not None and self.hash_buckets is None, "Only exact models keep the n-grams"
+        return sorted(self._vocab)
+
+    def count_table_entries(self) -> int:
+        """
+        Returns:
+            int: the number of stored (language, n-gram) counts, or (language,
+                bucket) counts if n-grams are hashed
+        """
+        assert self._ngram_counts is not None, "The model has no training counts"
+        return sum(len(counts) for counts in self._ngram_counts.values())
+
+    def count_table_bytes(self) -> int:
+        """
+        Returns:
+            int: memory taken by the training counts: the size of the count
+                arrays if n-grams are hashed, otherwise the (shallow) size of
+                the count dicts, their n-gram keys and count values
+        """
+        assert self._ngram_counts is not None, "The model has no training counts"
+        if self.hash_buckets is not None:
+            return sum(counts.nbytes for counts in self._ngram_counts.values())
+        return sum(sys.getsizeof(counts) + sum(sys.getsizeof(ngram) + sys.getsizeof(count)
+                                               for ngram, count in counts.items())
+                   for counts in self._ngram_counts.values())
+
+    def _is_loaded(self) -> bool:
+        """
+        Returns:
+            bool: True if the model only has the matrix parameters read by load
+        """
+        return self._label_counts is None and self._log_likelihood_matrix is not None
+
+    def save(self, path: str, dtype: str = "float64"):
+        """
+        Save the trained model to a single binary file: a sorted n-gram table
+        and a contiguous L x V log likelihood array, plus a small JSON header
+        with the languages, log priors and settings
+
+        Args:
+            path (str): the file path
+            dtype (str, optional): "float32" or "float64", the precision of the
+                stored log likelihoods. Defaults to "float64".
+        """
+        self._check_params()
+        if self._log_likelihood_matrix is None:
+            self._build_matrices(self._smoothing_k())
+        metadata = {
+            "format": type(self).__name__,
+            "version": MODEL_FORMAT_VERSION,
+            "ngram_size": self.ngram_size,
+            "extension": self.extension,
+            "hash_buckets": self.hash_buckets,
+            "langs": self._langs,
+            "log_priors": self._log_prior_vector.tolist(),
+            "stream_temperature": self.stream_temperature,
+        }
+        arrays = {"log_likelihoods": self._log_likelihood_matrix.astype(dtype)}
+        if self.hash_buckets is None:
+            arrays["ngram_index"] = self._ngram_index
+        save_arrays(path, metadata, arrays)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "NBLangIDModel":
+        """
+        Load a model written by save. The loaded model predicts with the
+        vectorized path; it can be retrained with fit but not updated with
+        partial_fit, since the counts are not saved.
+
+        Args:
+            path (str): the file path
+            mmap (bool, optional): memory map the arrays so that processes
+                loading the same file share them. Defaults to True.
+
+        Returns:
+            NBLangIDModel: the loaded model
+        """
+        metadata, arrays = load_arrays(path, mmap=mmap)
+        assert metadata.get("format") == cls.__name__, f"{path} does not hold a {cls.__name__}"
+        assert metadata["version"] == MODEL_FORMAT_VERSION, \
+            f"{path} uses model format version {metadata['version']}, expected {MODEL_FORMAT_VERSION}"
+        model = cls(ngram_size=metadata["ngram_size"], extension=metadata["extension"], vectorized=True,
+                    hash_buckets=metadata.get("hash_buckets"))
+        model._langs = metadata["langs"]
+        model._log_prior_vector = np.array(metadata["log_priors"])
+        model.stream_temperature = metadata["stream_temperature"]
+        model._index_ngrams(arrays.get("ngram_index"))
+        model._log_likelihood_matrix = arrays["log_likelihoods"]
+        return model
+
+    def _build_matrices(self, k: float):
+        """
+        Build the matrix mode parameters from the sparse counts: a sorted n-gram
+        index of size V and an L x V matrix of log likelihoods (rows follow
+        self._langs), smoothed the same way as self._likelihoods but as whole
+        arrays, like _build_hashed_matrices
+
+        Args:
+            k (float): the k value for add-k smoothing
+        """
+        # the vocab is every n-gram counted with some language, so one unique
+        # over all the counted n-grams gives the index and their columns
+        lang_counts = [self._ngram_counts[lang] for lang in self._langs]
+        ngrams = np.array([ngram for counts in lang_counts for ngram in counts], dtype=f"U{self.ngram_size}")
+        index, cols = np.unique(ngrams, return_inverse=True)
+        rows = np.repeat(np.arange(len(self._langs)), [len(counts) for counts in lang_counts])
+        counts = np.zeros((len(self._langs), len(index)))
+        counts[rows, cols] = np.fromiter((count for counts in lang_counts for count in counts.values()),
+                                         dtype=np.float64, count=len(ngrams))
+        V = len(index)
+        totals = counts.sum(axis=1, keepdims=True)
+        self._log_likelihood_matrix = np.log((counts + k) / (totals + V * k))
+        self._index_ngrams(index)
+
+    def _index_ngrams(self, index: Optional[np.ndarray]):
+        """
+        Set the sorted n-gram index. If ngram_size * NGRAM_ID_BITS <= 64, the
+        n-gram IDs from get_char_ngram_ids are exact and sort in the same order
+        as the n-grams, so the IDs of the index are kept too and sentences are
+        looked up by ID, which is faster than comparing strings.
+
+        Args:
+            index (Optional[np.ndarray]): the sorted n-grams, or None to drop
+                the index
+        """
+        self._ngram_index = index
+        self._ngram_index_ids = None
+        if index is not None and self.ngram_size * NGRAM_ID_BITS <= 64:
+            self._ngram_index_ids = get_char_ngram_ids(index.tolist(), self.ngram_size)[0]
+
+    def _build_hashed_matrices(self, k: float):
+        """
+        Build the matrix mode parameters from the counts per hash bucket. The
+        occupied buckets play the role of the vocab; the log likelihood of an
+        empty bucket is set to 0 so that its n-grams are skipped, like n-grams
+        that are not in the vocab.
+
+        Args:
+            k (float): the k value for add-k smoothing
+        """
+        counts = np.array([self._ngram_counts[lang] for lang in self._langs])
+        occupied = counts.any(axis=0)
+        V = np.count_nonzero(occupied)
+        totals = counts.sum(axis=1, keepdims=True)
+        self._log_likelihood_matrix = np.where(occupied, np.log((counts + k) / (totals + V * k)), 0.0)
+
+    def _ngram_columns(self, sentences: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the column of every n-gram of a batch of sentences. N-grams that
+        are not in the index are dropped, the same way predict_one_log_proba
+        skips n-grams without a likelihood.
+
+        Args:
+            sentences (List[str]): the (already lowercased, if needed) sentences
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the columns (n-gram index or bucket)
+                of the kept n-grams of every sentence, in order, and the number
+                of kept n-grams in each sentence
+        """
+        if self.hash_buckets is not None:
+            # n-grams in empty buckets have a log likelihood of 0
+            ngram_ids, counts = get_char_ngram_ids(sentences, self.ngram_size)
+            return hash_ngram_ids(ngram_ids, self.hash_buckets), counts
+
+        # look every n-gram up in the sorted index and keep the ones that are in it
+        if self._ngram_index_ids is not None:
+            index = self._ngram_index_ids
+            ngrams, counts = get_char_ngram_ids(sentences, self.ngram_size)
+        else:
+            index = self._ngram_index
+            ngrams, counts = get_char_ngram_array(sentences, self.ngram_size)
+        cols = np.searchsorted(index, ngrams)
+        found = cols < len(index)
+        found[found] = index[cols[found]] == ngrams[found]
+        rows = np.repeat(np.arange(len(sentences)), counts)
+        return cols[found], np.bincount(rows[found], minlength=len(sentences))
+
+    def _batch_log_likelihood(self, sentences: List[str]) -> np.ndarray:
+        """
+        Computes the log likelihood of each sentence under each language: the
+        log likelihood columns of its n-grams are gathered and summed per
+        sentence, for every language at once
+
+        Args:
+            sentences (List[str]): the (already lowercased, if needed) sentences
+
+        Returns:
+            np.ndarray: B x L matrix of log likelihoods, columns follow self._langs
+        """
+        cols, lengths = self._ngram_columns(sentences)
+        log_likelihoods = np.zeros((len(sentences), len(self._langs)))
+        # each sentence's n-grams are a contiguous run; reduceat needs
+        # non-empty runs, sentences without n-grams stay 0
+        nonempty = lengths > 0
+        if nonempty.any():
+            starts = np.cumsum(lengths) - lengths
+            log_likelihoods[nonempty] = np.add.reduceat(
+                np.take(self._log_likelihood_matrix, cols, axis=1), starts[nonempty], axis=1).T
+        return log_likelihoods
+
+    def _batch_log_proba(self, sentences: List[str]) -> np.ndarray:
+        """
+        Computes the log probability of each sentence being associated with each
+        language with one sparse-dense product
+
+        Args:
+            sentences (List[str]): the (already lowercased, if needed) sentences
+
+        Returns:
+            np.ndarray: B x L matrix of log probabilities, columns follow self._langs
+        """
+        return self._batch_log_likelihood(sentences) + self._log_prior_vector
+
+    def _ngram_log_likelihoods(self, ngrams: List[str]) -> np.ndarray:
+        """
+        Looks up the log likelihood of individual n-grams under each language;
+        n-grams that are not in the vocab get 0, so they do not change scores
+
+        Args:
+            ngrams (List[str]): the n-grams
+
+        Returns:
+            np.ndarray: N x L matrix of log likelihoods, columns follow self._langs
+        """
+        if self._log_likelihood_matrix is not None:
+            # an n-gram is its own (only) n-gram, so scoring each n-gram as a
+            # sentence gives its log likelihood
+            return self._batch_log_likelihood(ngrams)
+        return np.array([
+            [math.log(self._likelihoods[lang].get(ngram, self._unseen_likelihoods[lang]))
+             if ngram in self._vocab else 0.0 for lang in self._langs]
+            for ngram in ngrams]).reshape(len(ngrams), len(self._langs))
+
+    def predict_stream(self, chunks: Iterable[str], threshold: float = 0.99,
+                       temperature: Optional[float] = None, min_chars: int = 0) \
+        -> Tuple[str, Dict[str, float], int]:
+        """
+        Predict the language of a long document given as a stream of text
+        chunks, stopping as soon as one language is confident enough. N-grams
+        that span two chunks are scored, and a document shorter than
+        ngram_size is handled like in get_char_ngrams.
+
+        Args:
+            chunks (Iterable[str]): the document, in order
+            threshold (float, optional): stop once the posterior probability of
+                the best language reaches this value. Defaults to 0.99.
+            temperature (Optional[float], optional): the log scores are divided by
+                this before normalizing; naive Bayes posteriors are overconfident,
+                so values above 1 give better calibrated probabilities. Defaults
+                to None (self.stream_temperature, 1.0 until calibrate fits it on
+                held-out data).
+            min_chars (int, optional): read at least this many characters before
+                stopping. Defaults to 0.
+
+        Returns:
+            Tuple[str, Dict[str, float], int]: the predicted language, the posterior
+                probability of each language and the number of characters consumed
+        """
+        self._check_params()
+        if temperature is None:
+            temperature = self.stream_temperature
+        n = self.ngram_size
+        log_probs = self._log_prior_vector.copy()
+        # the last n - 1 characters read, so n-grams can span chunk boundaries
+        context = ""
+        consumed = 0
+        seen_ngrams = False
+
+        for chunk in chunks:
+            text = context + (chunk.lower() if self.extension else chunk)
+            ngrams = [text[i:i+n] for i in range(len(text) - n + 1)]
+            text_start = consumed - len(context)
+            consumed += len(chunk)
+            context = text[max(0, len(text) - n + 1):] if n > 1 else ""
+            if not ngrams:
+                continue
+            seen_ngrams = True
+
+            # running scores after each n-gram of the chunk
+            running = log_probs + np.cumsum(self._ngram_log_likelihoods(ngrams), axis=0)
+            posteriors = np.exp(_log_softmax(running / temperature))
+            ends = text_start + np.arange(len(ngrams)) + n
+            confident = (posteriors.max(axis=1) >= threshold) & (ends >= min_chars)
+            if confident.any():
+                i = int(confident.argmax())
+                return self._stream_result(running[i], temperature, int(ends[i]))
+            log_probs = running[-1]
+
+        if not seen_ngrams:
+            # special case: the whole document is shorter than ngram_size
+            log_probs = log_probs + self._ngram_log_likelihoods([context])[0]
+        return self._stream_result(log_probs, temperature, consumed)
+
+    def calibrate(self, sentences: List[str], labels: List[str], threshold: float = 0.99) -> float:
+        """
+        Fit the temperature predict_stream uses by default on held-out data.
+        predict_stream checks the posterior after every n-gram, so an
+        overconfident model gets many chances to cross the threshold too early.
+        Each sentence is streamed at every temperature in
+        CALIBRATION_TEMPERATURES, and the smallest temperature is kept such
+        that at it and every larger one, the sentences that reach threshold
+        are right at least threshold of the time when they do.
+
+        Args:
+            sentences (List[str]): held-out sentences (not used in training)
+            labels (List[str]): their languages
+            threshold (float, optional): the threshold predict_stream will be
+                used with. Defaults to 0.99.
+
+        Returns:
+            float: the temperature, also stored as self.stream_temperature
+        """
+        self._check_params()
+        lang_index = {lang: i for i, lang in enumerate(self._langs)}
+        # running scores after each n-gram of every sentence
+        scores, sentence_ids, sentence_labels = [], [], []
+        for i, (sentence, label) in enumerate(zip(sentences, labels)):
+            prefix = self.prefix_log_likelihoods(sentence.lower() if self.extension else sentence)[1:]
+            scores.append(prefix + self._log_prior_vector)
+            sentence_ids.append(np.full(len(prefix), i))
+            sentence_labels.append(lang_index[label])
+        scores = np.concatenate(scores)
+        sentence_ids = np.concatenate(sentence_ids)
+        sentence_labels = np.array(sentence_labels)
+
+        passes = []
+        for temperature in CALIBRATION_TEMPERATURES:
+            posteriors = np.exp(_log_softmax(scores / temperature))
+            confident = np.flatnonzero(posteriors.max(axis=1) >= threshold)
+            # a sentence stops at its first confident position
+            stopped, first = np.unique(sentence_ids[confident], return_index=True)
+            stops = confident[first]
+            correct = posteriors[stops].argmax(axis=1) == sentence_labels[stopped]
+            passes.append(len(stops) == 0 or correct.mean() >= threshold)
+        # the temperature after the last one that fails (the largest if all do)
+        failing = [i for i, ok in enumerate(passes) if not ok]
+        i = min(failing[-1] + 1, len(passes) - 1) if failing else 0
+        self.stream_temperature = float(CALIBRATION_TEMPERATURES[i])
+        return self.stream_temperature
+
+    def prefix_log_likelihoods(self, document: str) -> np.ndarray:
+        """
+        Computes the log likelihood of every n-gram position of a document under
+        each language once, as cumulative sums: the log likelihood of the n-grams
+        at positions start to end - 1 is prefix[end] - prefix[start], so any
+        window or segment can be scored in O(1)
+
+        Args:
+            document (str): the (already lowercased, if needed) document
+
+        Returns:
+            np.ndarray: (P + 1) x L prefix sums for the P n-grams of the
+                document, columns follow self._langs
+        """
+        self._check_params()
+        n = self.ngram_size
+        ngrams = [document[i:i+n] for i in range(len(document) - n + 1)]
+        prefix = np.zeros((len(ngrams) + 1, len(self._langs)))
+        if ngrams:
+            np.cumsum(self._ngram_log_likelihoods(ngrams), axis=0, out=prefix[1:])
+        return prefix
+
+    def segment(self, document: str, switch_penalty: float = 10.0, min_segment_length: int = 1) \
+        -> List[Tuple[int, int, str]]:
+        """
+        Split a document that switches between languages into single language
+        segments. Each segment is scored as its own naive Bayes document (log
+        prior plus the log likelihood of its n-grams), every switch costs
+        switch_penalty, and a dynamic program over the prefix sums finds the
+        best segmentation in O(P * L) time for P n-grams and L languages.
+
+        Args:
+            document (str): the document
+            switch_penalty (float, optional): log score cost of starting a new
+                segment. Defaults to 10.0.
+            min_segment_length (int, optional): minimum number of n-grams in a
+                segment. Defaults to 1.
+
+        Returns:
+            List[Tuple[int, int, str]]: (start, end, language) character spans
+                that cover the document (lowercased first if extension is True)
+        """
+        self._check_params()
+        document = document.lower() if self.extension else document
+        prefix = self.prefix_log_likelihoods(document)
+        P, L = len(prefix) - 1, len(self._langs)
+        m = max(1, min(min_segment_length, P))
+        if P == 0:
+            # special case: the document is shorter than ngram_size
+            log_probs = self._log_prior_vector + self._ngram_log_likelihoods([document])[0]
+            return [(0, len(document), self._langs[int(log_probs.argmax())])]
+
+        # best[i, l]: best score of the first i n-grams, where the last segment
+        # has language l and at least m n-grams; a segment either extends the
+        # previous one by an n-gram, or starts with a block of exactly m n-grams
+        best = np.full((P + 1, L), -np.inf)
+        # back[i, l]: -1 if position i extended a segment, otherwise the
+        # language of the segment before the block ending at i (L if none)
+        back = np.full((P + 1, L), -1, dtype=np.int64)
+        ngram_scores = np.diff(prefix, axis=0)
+        for i in range(m, P + 1):
+            block = prefix[i] - prefix[i - m] + self._log_prior_vector
+            if i == m:
+                best[i] = block
+                back[i] = L
+                continue
+            previous = int(best[i - m].argmax())
+            new_segment = best[i - m, previous] - switch_penalty + block
+            extend = best[i - 1] + ngram_scores[i - 1]
+            best[i] = np.maximum(extend, new_segment)
+            back[i] = np.where(extend >= new_segment, -1, previous)
+
+        # walk back from the best final language, collecting segment starts
+        spans = []
+        i, lang = P, int(best[P].argmax())
+        end = P
+        while i > 0:
+            if back[i, lang] == -1:
+                i -= 1
+                continue
+            start = i - m
+            spans.append((start, end, self._langs[lang]))
+            end, lang, i = start, int(back[i, lang]), start
+
+        # n-gram positions to character offsets; the last segment also covers
+        # the final n - 1 characters
+        spans.reverse()
+        start, _, lang = spans[-1]
+        spans[-1] = (start, len(document), lang)
+        return spans
+
+    def _stream_result(self, log_probs: np.ndarray, temperature: float, consumed: int) \
+        -> Tuple[str, Dict[str, float], int]:
+        """
+        Packs the label, normalized probabilities and characters consumed
+        returned by predict_stream
+        """
+        posteriors = np.exp(_log_softmax(log_probs / temperature))
+        return self._langs[int(log_probs.argmax())], dict(zip(self._langs, posteriors.tolist())), consumed
 
     def predict(self, test_sentences: List[str]) -> List[str]:
         """
@@ -78,7 +780,14 @@ class NBLangIDModel:
         Returns:
             List[str]: the predicted languages (in the same order)
         """
+        self._check_params()
         new_test_sentences = [sentence.lower() if self.extension else sentence for sentence in test_sentences]
+        if self.vectorized or self.hash_buckets is not None:
+            predictions = []
+            for start in range(0, len(new_test_sentences), VECTORIZED_BATCH_SIZE):
+                log_probs = self._batch_log_proba(new_test_sentences[start:start + VECTORIZED_BATCH_SIZE])
+                predictions.extend(self._langs[i] for i in log_probs.argmax(axis=1))
+            return predictions
         return [argmax(self.predict_one_log_proba(sentence)) for sentence in new_test_sentences]
         # return [argmax(self.predict_one_log_proba(sentence.lower())) for sentence in test_sentences]
 
@@ -92,18 +801,243 @@ class NBLangIDModel:
         Returns:
             Dict[str, float]: mapping of language --> probability
         """
-        assert not (self._priors is None or self._likelihoods is None), \
-            "Cannot predict without a model!"
+        self._check_params()
+        if self._is_loaded() or self.hash_buckets is not None:
+            return defaultdict(float, zip(self._langs, self._batch_log_proba([test_sentence])[0].tolist()))
         ngrams = get_char_ngrams(test_sentence, self.ngram_size)
         log_probs = defaultdict(float)
         for lang in self._priors.keys():
             log_probs[lang] = math.log(self._priors[lang])
             for ngram in ngrams:
-                if ngram in self._likelihoods[lang]:
-                    log_probs[lang] += math.log(self._likelihoods[lang][ngram])
+                if ngram in self._vocab:
+                    log_probs[lang] += math.log(self._likelihoods[lang].get(ngram, self._unseen_likelihoods[lang]))
+        return log_probs
+
+class MultiOrderNBLangIDModel(NBLangIDModel):
+    def __init__(self, ngram_size: int = 3, extension: bool = False,
+                 weights: Optional[List[float]] = None, backoff: bool = False):
+        """
+        Naive Bayes model over every n-gram order from 1 to ngram_size. All
+        orders are extracted in one sweep over each sentence and counted in
+        separate tables.
+
+        Args:
+            ngram_size (int, optional): the highest n-gram order. Defaults to 3.
+            extension (bool, optional): set to True to use extension code. Defaults to False.
+            weights (Optional[List[float]], optional): weight of each order (1 to
+                ngram_size) when interpolating log likelihoods. Defaults to equal weights.
+            backoff (bool, optional): instead of interpolating, score each position
+                with the highest order n-gram starting there that is in that order's
+                vocab. Defaults to False.
+        """
+        super().__init__(ngram_size=ngram_size, extension=extension)
+        self.weights = weights if weights is not None else [1 / ngram_size] * ngram_size
+        assert len(self.weights) == ngram_size, "Need one weight per n-gram order"
+        self.backoff = backoff
+
+    def _reset_counts(self):
+        """
+        Start from empty training counts, one table per order
+        """
+        self._vocab = [set() for _ in range(self.ngram_size)]
+        self._ngram_counts = [defaultdict(Counter) for _ in range(self.ngram_size)]
+        self._label_counts = Counter()
+
+    def partial_fit(self, train_sentences: List[str], train_labels: List[str],
+                    pool: Optional[multiprocessing.pool.Pool] = None):
+        """
+        Update the n-gram counts of every order and the label counts
+
+        Args:
+            train_sentences (List[str]): sentences from the training data
+            train_labels (List[str]): labels from the training data
+            pool (Optional[multiprocessing.pool.Pool], optional): not used,
+                multi-order models count in this process. Defaults to None.
+        """
+        assert not self._is_loaded(), "Cannot update a model loaded from a file, use fit instead"
+        if self._ngram_counts is None:
+            self._reset_counts()
+        for sent, lang in zip(train_sentences, train_labels):
+            sentence = sent.lower() if self.extension else sent # lowercase if extension is True
+            for order, ngrams in enumerate(get_multi_order_char_ngrams(sentence, self.ngram_size)):
+                self._vocab[order].update(ngrams)
+                self._ngram_counts[order][lang].update(ngrams)
+        self._label_counts.update(train_labels)
+        self._priors = None
+
+    def _update_params(self):
+        """
+        Compute the priors and the add-k smoothed likelihoods of every order
+        """
+        assert self._ngram_counts is not None, "Cannot predict without a model!"
+        self._update_priors()
+        k = self._smoothing_k()
+        self._likelihoods, self._unseen_likelihoods = zip(*[
+            _smooth_likelihoods(ngram_counts, vocab, k)
+            for ngram_counts, vocab in zip(self._ngram_counts, self._vocab)])
+
+    def _ngram_log_likelihoods(self, ngrams: List[str]) -> np.ndarray:
+        """
+        Looks up the log likelihood of n-grams of the highest order under each
+        language by combining their prefixes of every order, the same way
+        predict_one_log_proba combines the n-grams starting at a position:
+        interpolated with self.weights, or only the highest order prefix in
+        its order's vocab if self.backoff. Prefixes that are not in the vocab
+        get 0. Summed over the n-gram positions of a document, this scores
+        every n-gram except the lower order ones starting in the last
+        ngram_size - 1 characters.
+
+        Args:
+            ngrams (List[str]): the n-grams
+
+        Returns:
+            np.ndarray: N x L matrix of log likelihoods, columns follow self._langs
+        """
+        log_likelihoods = np.zeros((len(ngrams), len(self._langs)))
+        for row, ngram in enumerate(ngrams):
+            for order in range(min(self.ngram_size, len(ngram)), 0, -1):
+                prefix = ngram[:order]
+                if prefix not in self._vocab[order - 1]:
+                    continue
+                weight = 1 if self.backoff else self.weights[order - 1]
+                log_likelihoods[row] += [weight * self._log_likelihood(order, lang, prefix) for lang in self._langs]
+                if self.backoff:
+                    break
+        return log_likelihoods
+
+    def save(self, path: str, dtype: str = "float64"):
+        """
+        Save the trained model to a single binary file: for each order, a
+        sorted n-gram table and an L x V log likelihood array (like
+        NBLangIDModel.save), plus a JSON header with the languages, priors,
+        weights and settings
+
+        Args:
+            path (str): the file path
+            dtype (str, optional): "float32" or "float64", the precision of the
+                stored log likelihoods. Defaults to "float64".
+        """
+        self._check_params()
+        arrays = {}
+        for order in range(1, self.ngram_size + 1):
+            if self._is_loaded():
+                ngram_index = self._ngram_index[order - 1]
+                log_likelihoods = self._log_likelihood_matrix[order - 1]
+            else:
+                ngram_index = np.unique(np.array(list(self._vocab[order - 1]), dtype=f"U{order}"))
+                log_likelihoods = np.array([[self._log_likelihood(order, lang, ngram) for ngram in ngram_index.tolist()]
+                                            for lang in self._langs]).reshape(len(self._langs), len(ngram_index))
+            arrays[f"ngram_index_{order}"] = ngram_index
+            arrays[f"log_likelihoods_{order}"] = np.asarray(log_likelihoods).astype(dtype)
+        save_arrays(path, {
+            "format": type(self).__name__,
+            "version": MODEL_FORMAT_VERSION,
+            "ngram_size": self.ngram_size,
+            "extension": self.extension,
+            "weights": self.weights,
+            "backoff": self.backoff,
+            "langs": self._langs,
+            "priors": [self._priors[lang] for lang in self._langs],
+            "stream_temperature": self.stream_temperature,
+        }, arrays)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "MultiOrderNBLangIDModel":
+        """
+        Load a model written by save. Like NBLangIDModel.load, the loaded
+        model can be retrained with fit but not updated with partial_fit.
+
+        Args:
+            path (str): the file path
+            mmap (bool, optional): memory map the arrays. Defaults to True.
+
+        Returns:
+            MultiOrderNBLangIDModel: the loaded model
+        """
+        metadata, arrays = load_arrays(path, mmap=mmap)
+        assert metadata.get("format") == cls.__name__, f"{path} does not hold a {cls.__name__}"
+        assert metadata["version"] == MODEL_FORMAT_VERSION, \
+            f"{path} uses model format version {metadata['version']}, expected {MODEL_FORMAT_VERSION}"
+        ngram_size = metadata["ngram_size"]
+        model = cls(ngram_size=ngram_size, extension=metadata["extension"], weights=metadata["weights"],
+                    backoff=metadata["backoff"])
+        model._langs = metadata["langs"]
+        model._priors = dict(zip(model._langs, metadata["priors"]))
+        model.stream_temperature = metadata["stream_temperature"]
+        model._log_prior_vector = np.log(np.array(metadata["priors"]))
+        model._ngram_index = [arrays[f"ngram_index_{order}"] for order in range(1, ngram_size + 1)]
+        model._log_likelihood_matrix = [arrays[f"log_likelihoods_{order}"] for order in range(1, ngram_size + 1)]
+        # n-gram --> column, also used as the vocab of each order
+        model._vocab = [{ngram: i for i, ngram in enumerate(ngram_index.tolist())}
+                        for ngram_index in model._ngram_index]
+        return model
+
+    def predict(self, test_sentences: List[str]) -> List[str]:
+        """
+        Predict labels for a list of sentences
+
+        Args:
+            test_sentences (List[str]): the sentence to predict the language of
+
+        Returns:
+            List[str]: the predicted languages (in the same order)
+        """
+        self._check_params()
+        new_test_sentences = [sentence.lower() if self.extension else sentence for sentence in test_sentences]
+        return [argmax(self.predict_one_log_proba(sentence)) for sentence in new_test_sentences]
+
+    def predict_one_log_proba(self, test_sentence: str) -> Dict[str, float]:
+        """
+        Computes the log probability of a single sentence being associated with
+        each language, interpolating (or backing off) between n-gram orders
+
+        Args:
+            test_sentence (str): the sentence to predict the language of
+
+        Returns:
+            Dict[str, float]: mapping of language --> probability
+        """
+        self._check_params()
+        ngrams_by_order = get_multi_order_char_ngrams(test_sentence, self.ngram_size)
+        log_probs = defaultdict(float)
+        for lang in self._priors.keys():
+            log_probs[lang] = math.log(self._priors[lang])
+
+        if self.backoff:
+            # the n-gram of order j starting at position i is ngrams_by_order[j - 1][i]
+            for i in range(len(test_sentence)):
+                for order in range(min(self.ngram_size, len(test_sentence) - i), 0, -1):
+                    ngram = ngrams_by_order[order - 1][i]
+                    if ngram in self._vocab[order - 1]:
+                        for lang in self._priors.keys():
+                            log_probs[lang] += self._log_likelihood(order, lang, ngram)
+                        break
+            return log_probs
+
+        for order, ngrams in enumerate(ngrams_by_order, start=1):
+            weight = self.weights[order - 1]
+            for ngram in ngrams:
+                if ngram in self._vocab[order - 1]:
+                    for lang in self._priors.keys():
+                        log_probs[lang] += weight * self._log_likelihood(order, lang, ngram)
         return log_probs
 
+    def _log_likelihood(self, order: int, lang: str, ngram: str) -> float:
+        """
+        Args:
+            order (int): the n-gram order
+            lang (str): the language
+            ngram (str): an n-gram in the vocab of that order
+
+        Returns:
+            float: the smoothed log likelihood of the n-gram for the language
+        """
+        if self._is_loaded():
+            return float(self._log_likelihood_matrix[order - 1][self._langs.index(lang), self._vocab[order - 1][ngram]])
+        likelihood = self._likelihoods[order - 1][lang].get(ngram, self._unseen_likelihoods[order - 1][lang])
+        return math.log(likelihood)
+
 # if __name__ == "__main__":
 #     model = NBLangIDModel(ngram_size=2)
 #     model.fit(["ablaze", "hablo", "learn"], ["eng", "spa", "eng"])
-#     print(model.predict_one_log_proba("able"))
\ No newline at end of file
+#     print(model.predict_one_log_proba("able"))
@@ -1,6 +1,8 @@
-from typing import Any, List
+from typing import Any, Dict, List, Sequence, Union
 from itertools import combinations
 
+import numpy as np
+
 
 def accuracy_score(y_true: List[Any], y_pred: List[Any]) -> float:
     """
@@ -23,6 +25,52 @@ def accuracy_score(y_true: List[Any], y_pred: List[Any]) -> float:
     return num_correct / len(y_true)
     
 
+def encode_labels(y: Union[Sequence[Any], np.ndarray], labels: List[Any]) -> np.ndarray:
+    """
+    Encode labels as their positions in the labels list. Integer arrays are
+    assumed to be encoded already and are returned as they are, after
+    checking that they are valid positions.
+
+    Args:
+        y (Union[Sequence[Any], np.ndarray]): labels to encode
+        labels (List[Any]): the label order
+
+    Returns:
+        np.ndarray: the encoded labels
+    """
+    if isinstance(y, np.ndarray) and np.issubdtype(y.dtype, np.integer):
+        assert len(y) == 0 or (y.min() >= 0 and y.max() < len(labels)), \
+            f"Encoded labels should be between 0 and {len(labels) - 1}"
+        return y
+    label_ids = {label: i for i, label in enumerate(labels)}
+    try:
+        return np.fromiter((label_ids[label] for label in y), dtype=np.int64, count=len(y))
+    except KeyError as e:
+        raise AssertionError(
+            f"All labels from y_true and y_pred should be in labels, missing {e.args[0]}") from None
+
+
+def confusion_matrix_array(y_true: Union[Sequence[Any], np.ndarray],
+                           y_pred: Union[Sequence[Any], np.ndarray], labels: List[Any]) -> np.ndarray:
+    """
+    Builds a confusion matrix as a NumPy array with one bincount over
+    pred * L + true. Rows are predicted labels and columns are true labels,
+    in the order of the labels variable.
+
+    Args:
+        y_true (Union[Sequence[Any], np.ndarray]): true labels (or encoded labels)
+        y_pred (Union[Sequence[Any], np.ndarray]): predicted labels (or encoded labels)
+        labels (List[Any]): the column/rows labels for the matrix
+
+    Returns:
+        np.ndarray: L x L matrix of counts
+    """
+    assert len(y_true) == len(y_pred), "y_true and y_pred must have the same length"
+    L = len(labels)
+    true, pred = encode_labels(y_true, labels), encode_labels(y_pred, labels)
+    return np.bincount(pred * L + true, minlength=L * L).reshape(L, L)
+
+
 def confusion_matrix(y_true: List[Any], y_pred: List[Any], labels: List[Any]) \
     -> List[List[int]]:
     """
@@ -37,24 +85,48 @@ def confusion_matrix(y_true: List[Any], y_pred: List[Any], labels: List[Any]) \
     Returns:
         List[List[int]]: the confusion matrix
     """
-    # check that all of the labels in y_true and y_pred are in the header list
-    for label in y_true + y_pred:
-        assert label in labels, \
-            f"All labels from y_true and y_pred should be in labels, missing {label}"
-    
-    all_combinations = [(label, label2) for label in labels for label2 in labels]
-    # print(all_combinations)
-    # create dict to map (pred, true) to count
-    confusion_dict = {comb: 0 for comb in all_combinations}
-    # print(confusion_dict)
-    for pred, true in zip(y_pred, y_true):
-        confusion_dict[(pred, true)] += 1
-    # print(confusion_dict)
-
-    # create a list of lists to represent the confusion matrix
-    confusion_matrix = [[confusion_dict[(pred, true)] for true in labels] for pred in labels]
-    return confusion_matrix
-        
+    return confusion_matrix_array(y_true, y_pred, labels).tolist()
+
+
+def classification_report(y_true: Union[Sequence[Any], np.ndarray],
+                          y_pred: Union[Sequence[Any], np.ndarray], labels: List[Any]) \
+    -> Dict[Any, Dict[str, float]]:
+    """
+    Computes precision, recall and F1 for every label, plus their macro
+    (unweighted mean over labels) and micro (pooled over all predictions)
+    averages. Labels that are never predicted (or never true) get a precision
+    (or recall) of 0.
+
+    Args:
+        y_true (Union[Sequence[Any], np.ndarray]): true labels (or encoded labels)
+        y_pred (Union[Sequence[Any], np.ndarray]): predicted labels (or encoded labels)
+        labels (List[Any]): the labels to report
+
+    Returns:
+        Dict[Any, Dict[str, float]]: mapping of label (or "macro" / "micro") -->
+            {"precision", "recall", "f1", "support"}
+    """
+    matrix = confusion_matrix_array(y_true, y_pred, labels)
+    true_positives = np.diag(matrix)
+    predicted = matrix.sum(axis=1)
+    support = matrix.sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted > 0, true_positives / predicted, 0.0)
+        recall = np.where(support > 0, true_positives / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    report = {label: {"precision": float(precision[i]), "recall": float(recall[i]),
+                      "f1": float(f1[i]), "support": int(support[i])}
+              for i, label in enumerate(labels)}
+    report["macro"] = {"precision": float(precision.mean()), "recall": float(recall.mean()),
+                       "f1": float(f1.mean()), "support": int(support.sum())}
+    # every prediction is a true positive for one label and a false positive
+    # for another, so micro precision, recall and F1 are all the accuracy
+    micro = float(true_positives.sum() / max(support.sum(), 1))
+    report["micro"] = {"precision": micro, "recall": micro, "f1": micro, "support": int(support.sum())}
+    return report
+
 
 
 # if __name__ == "__main__":
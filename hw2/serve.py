@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import collections
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from util import load_data
+from model import NBLangIDModel
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        """
+        Least recently used cache of predictions
+
+        Args:
+            maxsize (int): maximum number of entries (0 disables the cache)
+        """
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Args:
+            key (str): the input text
+
+        Returns:
+            Optional[str]: the cached prediction, or None
+        """
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key: str, value: str):
+        """
+        Args:
+            key (str): the input text
+            value (str): its prediction
+        """
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class MicroBatcher:
+    def __init__(self, model: NBLangIDModel, batch_size: int = 256, max_delay: float = 0.005,
+                 cache_size: int = 10000, latency_window: int = 10000):
+        """
+        Collects concurrent prediction requests into batches, so that the model
+        scores many sentences per call. A batch is scored when it has batch_size
+        requests or when its oldest request has waited max_delay seconds.
+
+        Args:
+            model (NBLangIDModel): a trained model
+            batch_size (int, optional): maximum batch size. Defaults to 256.
+            max_delay (float, optional): maximum time (seconds) a request waits for
+                its batch to fill up. Defaults to 0.005.
+            cache_size (int, optional): number of predictions kept in the LRU cache.
+                Defaults to 10000.
+            latency_window (int, optional): number of recent request latencies used
+                for the percentiles. Defaults to 10000.
+        """
+        self.model = model
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.cache = LRUCache(cache_size)
+        self._queue = asyncio.Queue()
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._counters = collections.Counter()
+
+    async def predict(self, text: str) -> str:
+        """
+        Predict the language of one text, waiting for its batch to be scored
+
+        Args:
+            text (str): the text
+
+        Returns:
+            str: the predicted language
+        """
+        start = time.perf_counter()
+        self._counters["requests"] += 1
+        prediction = self.cache.get(text)
+        if prediction is not None:
+            self._counters["cache_hits"] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put((text, future))
+            prediction = await future
+        self._latencies.append(time.perf_counter() - start)
+        return prediction
+
+    async def run(self):
+        """
+        Score batches from the queue forever
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # the same text can be queued more than once before it is cached
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                # score in a thread so that the event loop keeps accepting requests
+                predictions = dict(zip(texts, await loop.run_in_executor(None, self.model.predict, texts)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for text, future in batch:
+                self.cache.put(text, predictions[text])
+                future.set_result(predictions[text])
+            self._counters["batches"] += 1
+            self._counters["batched_requests"] += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: queue depth, request/batch/cache counters and p50/p99
+                latency (milliseconds) over the recent requests
+        """
+        latencies = np.array(self._latencies) * 1000
+        batches = self._counters["batches"]
+        return {
+            "queue_depth": self._queue.qsize(),
+            "requests": self._counters["requests"],
+            "cache_hits": self._counters["cache_hits"],
+            "cache_size": len(self.cache),
+            "batches": batches,
+            "mean_batch_size": self._counters["batched_requests"] / batches if batches else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+        }
+
+
+async def handle_client(batcher: MicroBatcher, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Serve one connection. Each request is a JSON line, either
+    {"id": ..., "text": "..."} (answered with {"id": ..., "lang": "..."}) or
+    {"stats": true}. Invalid requests are answered with
+    {"id": ..., "error": "..."}. Requests on a connection are handled
+    concurrently, so responses can come back out of order; use the id to
+    match them.
+
+    Args:
+        batcher (MicroBatcher): the batcher to send requests to
+        reader (asyncio.StreamReader): the connection's reader
+        writer (asyncio.StreamWriter): the connection's writer
+    """
+    async def send(response: Dict[str, Any]):
+        writer.write((json.dumps(response) + "\n").encode("utf-8"))
+        await writer.drain()
+
+    async def respond(request: Dict[str, Any]):
+        if request.get("stats"):
+            await send(batcher.stats())
+        else:
+            await send({"id": request.get("id"), "lang": await batcher.predict(request["text"])})
+
+    tasks = set()
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            await send({"error": "expected a JSON object with a text or stats key"})
+            continue
+        # check the text here: a bad text would fail every request in its batch
+        if not request.get("stats") and not isinstance(request.get("text"), str):
+            await send({"id": request.get("id"), "error": "text should be a string"})
+            continue
+        task = asyncio.create_task(respond(request))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    writer.close()
+
+
+async def serve(model: NBLangIDModel, host: str, port: int, **batcher_kwargs):
+    """
+    Serve language ID predictions as JSON lines over TCP until interrupted
+
+    Args:
+        model (NBLangIDModel): a trained model
+        host (str): address to listen on
+        port (int): port to listen on
+        batcher_kwargs: passed on to MicroBatcher
+    """
+    batcher = MicroBatcher(model, **batcher_kwargs)
+    batch_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_client(batcher, reader, writer), host, port)
+    print(f"Serving on {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+
+
+def main():
+    """
+    Serve a language ID model locally. Train one on the fly or load one saved
+    with test.py --save_model:
+        python serve.py --load_model model.bin --port 8457
+    then send JSON lines, e.g.:
+        echo '{"id": 1, "text": "hola a todos"}' | nc localhost 8457
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--load_model",
+        type=str,
+        help="A model saved with test.py --save_model")
+    parser.add_argument(
+        "--train_file_path",
+        type=str,
+        help="Train a vectorized model on this file instead of loading one")
+    parser.add_argument(
+        "--ngram_size",
+        default=2,
+        type=int,
+        help="The size of character n-grams to use when training")
+    parser.add_argument("--host", default="127.0.0.1", type=str, help="Address to listen on")
+    parser.add_argument("--port", default=8457, type=int, help="Port to listen on")
+    parser.add_argument(
+        "--batch_size",
+        default=256,
+        type=int,
+        help="Maximum number of requests scored together")
+    parser.add_argument(
+        "--max_delay_ms",
+        default=5.0,
+        type=float,
+        help="Maximum time a request waits for its batch to fill up")
+    parser.add_argument(
+        "--cache_size",
+        default=10000,
+        type=int,
+        help="Number of predictions kept in the LRU cache")
+    args = parser.parse_args()
+
+    if args.load_model is not None:
+        model = NBLangIDModel.load(args.load_model)
+    elif args.train_file_path is not None:
+        model = NBLangIDModel(ngram_size=args.ngram_size, vectorized=True)
+        model.fit(*load_data(args.train_file_path))
+    else:
+        parser.error("one of --load_model or --train_file_path is required")
+
+    try:
+        asyncio.run(serve(model, args.host, args.port, batch_size=args.batch_size,
+                          max_delay=args.max_delay_ms / 1000, cache_size=args.cache_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
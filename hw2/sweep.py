@@ -0,0 +1,172 @@
+import argparse
+import itertools
+import multiprocessing
+import random
+import statistics
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from scoring import accuracy_score
+from util import load_data
+from model import NBLangIDModel
+
+
+# the data set, shared with worker processes by the pool initializer
+_sentences = None
+_labels = None
+
+
+def _init_worker(sentences: List[str], labels: List[str]):
+    global _sentences, _labels
+    _sentences, _labels = sentences, labels
+
+
+def _evaluate_fold(task: Tuple[List[int], List[int], int, List[float], List[bool], bool, int]) \
+    -> List[Dict[str, Any]]:
+    """
+    Count the n-grams of one training fold once, then score the held out fold
+    with every smoothing setting
+
+    Args:
+        task (Tuple[List[int], List[int], int, List[float], List[bool], bool, int]):
+            training indices, held out indices, n-gram size, k values, equal_priors
+            values, whether to use the vectorized path and the fold number
+
+    Returns:
+        List[Dict[str, Any]]: one result per (k, equal_priors)
+    """
+    train_indices, test_indices, ngram_size, ks, priors, vectorized, fold = task
+    test_sentences = [_sentences[i] for i in test_indices]
+    test_labels = [_labels[i] for i in test_indices]
+
+    model = NBLangIDModel(ngram_size=ngram_size, vectorized=vectorized)
+    start = time.perf_counter()
+    model.fit([_sentences[i] for i in train_indices], [_labels[i] for i in train_indices])
+    count_seconds = time.perf_counter() - start
+
+    results = []
+    for k, equal_priors in itertools.product(ks, priors):
+        start = time.perf_counter()
+        model.set_smoothing(k=k, equal_priors=equal_priors)
+        predictions = model.predict(test_sentences)
+        results.append({
+            "fold": fold, "ngram_size": ngram_size, "k": k, "equal_priors": equal_priors,
+            "accuracy": accuracy_score(test_labels, predictions),
+            "count_seconds": count_seconds, "predict_seconds": time.perf_counter() - start,
+        })
+    return results
+
+
+def k_fold_indices(num_items: int, num_folds: int, seed: int = 457) -> List[Tuple[List[int], List[int]]]:
+    """
+    Split item indices into shuffled folds
+
+    Args:
+        num_items (int): number of items
+        num_folds (int): number of folds
+        seed (int, optional): random seed for the shuffle. Defaults to 457.
+
+    Returns:
+        List[Tuple[List[int], List[int]]]: (training indices, held out indices) for each fold
+    """
+    indices = list(range(num_items))
+    random.Random(seed).shuffle(indices)
+    folds = [indices[i::num_folds] for i in range(num_folds)]
+    return [(sorted(itertools.chain.from_iterable(folds[:i] + folds[i + 1:])), sorted(folds[i]))
+            for i in range(num_folds)]
+
+
+def main():
+    """
+    Cross-validate NBLangIDModel over n-gram sizes, smoothing k values and
+    priors. N-grams are counted once per fold and n-gram size; every k and
+    prior reuses those counts. For example:
+        python sweep.py data/train.tsv --avg_samples_per_language 500 --ngram_sizes 1 2 3 --ks 1 .1 .01
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "train_file_path",
+        type=str,
+        help="The file to cross-validate on")
+    parser.add_argument(
+        "--avg_samples_per_language",
+        type=int,
+        help="The number of samples to use per language. If not given, loads the full dataset.")
+    parser.add_argument(
+        "--folds",
+        default=5,
+        type=int,
+        help="Number of cross-validation folds")
+    parser.add_argument(
+        "--ngram_sizes",
+        nargs="+",
+        default=[1, 2, 3],
+        type=int,
+        help="The sizes of character n-grams to try")
+    parser.add_argument(
+        "--ks",
+        nargs="+",
+        default=[1, .5, .1, .05, .01],
+        type=float,
+        help="The add-k smoothing values to try")
+    parser.add_argument(
+        "--priors",
+        nargs="+",
+        default=["data", "equal"],
+        choices=["data", "equal"],
+        help="Priors to try: label frequencies (data) and/or uniform (equal)")
+    parser.add_argument(
+        "--vectorized",
+        action="store_true",
+        help="Score the held out folds with the vectorized path")
+    parser.add_argument(
+        "--n_jobs",
+        default=1,
+        type=int,
+        help="Number of worker processes (-1 for all cores)")
+    args = parser.parse_args()
+
+    sentences, labels = load_data(args.train_file_path, avg_samples_per_language=args.avg_samples_per_language)
+    priors = [prior == "equal" for prior in args.priors]
+    tasks = [(train_indices, test_indices, ngram_size, args.ks, priors, args.vectorized, fold)
+             for ngram_size in args.ngram_sizes
+             for fold, (train_indices, test_indices) in enumerate(k_fold_indices(len(sentences), args.folds))]
+
+    start = time.perf_counter()
+    n_jobs = multiprocessing.cpu_count() if args.n_jobs == -1 else args.n_jobs
+    if n_jobs > 1:
+        with multiprocessing.Pool(n_jobs, initializer=_init_worker, initargs=(sentences, labels)) as pool:
+            fold_results = pool.map(_evaluate_fold, tasks)
+    else:
+        _init_worker(sentences, labels)
+        fold_results = [_evaluate_fold(task) for task in tasks]
+    total_seconds = time.perf_counter() - start
+
+    # average over folds
+    by_setting = defaultdict(list)
+    for result in itertools.chain.from_iterable(fold_results):
+        by_setting[result["ngram_size"], result["k"], result["equal_priors"]].append(result)
+    leaderboard = []
+    for (ngram_size, k, equal_priors), results in by_setting.items():
+        accuracies = [result["accuracy"] for result in results]
+        leaderboard.append((
+            statistics.mean(accuracies),
+            statistics.stdev(accuracies) if len(accuracies) > 1 else 0.0,
+            ngram_size, k, "equal" if equal_priors else "data",
+            statistics.mean(result["count_seconds"] for result in results),
+            statistics.mean(result["predict_seconds"] for result in results),
+        ))
+    leaderboard.sort(key=lambda row: -row[0])
+
+    print(f"{len(sentences)} sentences, {args.folds} folds, {len(leaderboard)} settings, "
+          f"{total_seconds:.1f}s total")
+    print(f"{'rank':>4} | {'accuracy':>15} | {'n':>2} | {'k':>6} | {'priors':>6} | {'count s':>8} | {'predict s':>9}")
+    print("-" * 70)
+    for rank, (accuracy, std, ngram_size, k, prior, count_seconds, predict_seconds) in enumerate(leaderboard, 1):
+        print(f"{rank:>4} | {accuracy:>7.2%} ± {std:>5.2%} | {ngram_size:>2} | {k:>6g} | {prior:>6} | "
+              f"{count_seconds:>8.3f} | {predict_seconds:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
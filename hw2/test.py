@@ -1,7 +1,9 @@
 import argparse
-from scoring import accuracy_score, confusion_matrix
-from util import LANGUAGES, load_data, print_confusion_matrix
-from model import NBLangIDModel
+import contextlib
+import multiprocessing
+from scoring import accuracy_score, classification_report, confusion_matrix
+from util import LANGUAGES, load_data, load_data_chunks, print_confusion_matrix
+from model import MultiOrderNBLangIDModel, NBLangIDModel
 
 
 def main():
@@ -27,26 +29,82 @@ def main():
         help="The number of samples to use per language. If not given, loads the full dataset. "
              "Set this to a number like 100 when debugging, then increase to increase model "
              "performance.")
+    parser.add_argument(
+        "--stratified",
+        action="store_true",
+        help="Sample exactly --avg_samples_per_language sentences of each language, "
+             "in one pass over the file")
     parser.add_argument(
         "--ngram_size",
         default=2,
         type=int,
         help="The size of character n-grams to use")
+    parser.add_argument(
+        "--multi_order",
+        action="store_true",
+        help="Use every n-gram order from 1 to --ngram_size, with equal interpolation weights")
+    parser.add_argument(
+        "--backoff",
+        action="store_true",
+        help="With --multi_order, back off to lower orders instead of interpolating")
+    parser.add_argument(
+        "--vectorized",
+        action="store_true",
+        help="Score the test set in batches with NumPy instead of the likelihood dicts")
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        help="If given, stream the training file and train on this many rows at a time "
+             "(ignores --avg_samples_per_language for the training data)")
+    parser.add_argument(
+        "--n_jobs",
+        default=1,
+        type=int,
+        help="Number of worker processes used to count n-grams during training (-1 for all cores)")
+    parser.add_argument(
+        "--save_model",
+        type=str,
+        help="Save the trained model to this file")
+    parser.add_argument(
+        "--load_model",
+        type=str,
+        help="Load a model saved with --save_model instead of training one "
+             "(train_file_path is ignored; pass --multi_order for a multi-order model)")
     args = parser.parse_args()
+    if args.multi_order and (args.vectorized or args.n_jobs != 1):
+        parser.error("--multi_order does not support --vectorized or --n_jobs")
 
-    # load data
-    train_sentences, train_labels = load_data(
-        args.train_file_path, avg_samples_per_language=args.avg_samples_per_language)
-    test_sentences, test_labels = load_data(
-        args.test_file_path, avg_samples_per_language=args.avg_samples_per_language)
+    # train (or load) model
+    if args.load_model is not None:
+        model_class = MultiOrderNBLangIDModel if args.multi_order else NBLangIDModel
+        model = model_class.load(args.load_model)
+    else:
+        if args.multi_order:
+            model = MultiOrderNBLangIDModel(ngram_size=args.ngram_size, backoff=args.backoff)
+        else:
+            model = NBLangIDModel(ngram_size=args.ngram_size, vectorized=args.vectorized, n_jobs=args.n_jobs)
+        if args.chunk_size is not None:
+            # one pool counts every chunk, instead of a new pool per chunk
+            with multiprocessing.Pool(model.n_jobs) if model.n_jobs > 1 else contextlib.nullcontext() as pool:
+                for train_sentences, train_labels in load_data_chunks(args.train_file_path, args.chunk_size):
+                    model.partial_fit(train_sentences, train_labels, pool=pool)
+        else:
+            train_sentences, train_labels = load_data(
+                args.train_file_path, avg_samples_per_language=args.avg_samples_per_language,
+                stratified=args.stratified)
+            model.fit(train_sentences, train_labels)
+    if args.save_model is not None:
+        model.save(args.save_model)
 
-    # train model and get predictions
-    model = NBLangIDModel(ngram_size=args.ngram_size)
-    model.fit(train_sentences, train_labels)
+    # get predictions
+    test_sentences, test_labels = load_data(
+        args.test_file_path, avg_samples_per_language=args.avg_samples_per_language,
+        stratified=args.stratified)
     predictions = model.predict(test_sentences)
 
     # evaluate model
     print(accuracy_score(test_labels, predictions))
+    print("Macro F1: {0:.4f}".format(classification_report(test_labels, predictions, LANGUAGES)["macro"]["f1"]))
     print_confusion_matrix(confusion_matrix(test_labels, predictions, LANGUAGES), LANGUAGES)
 
 
@@ -1,6 +1,9 @@
 import math
+import os
+import tempfile
 
 from model import NBLangIDModel
+from util import get_char_ngram_ids
 
 
 def main():
@@ -22,6 +25,21 @@ def main():
     print({lang: math.e ** log_prob
            for lang, log_prob in results.items()})
 
+    # save, update the model with partial_fit and save again: the second
+    # file should hold the updated model
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "model.bin")
+        model.save(path)
+        model.partial_fit(["hola", "hablo"], ["spa", "spa"])
+        model.save(path)
+        updated = model.predict_one_log_proba(test_sentences[0])
+        loaded = NBLangIDModel.load(path).predict_one_log_proba(test_sentences[0])
+    print("Should be True:", all(math.isclose(updated[lang], loaded[lang]) for lang in updated))
+
+    # n-grams too long to pack into one integer still get distinct IDs
+    ngram_ids, _ = get_char_ngram_ids(["abcde", "xbcde", "zzcde", "ybcde", "abcdz"], 5)
+    print("Should be 5:", len(set(ngram_ids.tolist())))
+
 
 if __name__ == "__main__":
     main()
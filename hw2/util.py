@@ -1,15 +1,79 @@
 import csv
 import itertools
+import json
 import math
 import random
-from typing import Any, Dict, List, Optional, Tuple
+import struct
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
 
 
 LANGUAGES = ["eng", "rus", "ita", "spa", "fra", "tur", "deu", "cmn"]
 
+# array files start with the magic bytes, then the little endian uint32
+# length of a JSON header, then the header and the raw array data. hw3/corpus.py
+# has a copy of the helpers that read and write them, keep the two in sync
+ARRAY_FILE_MAGIC = b"CS457ARR"
+ARRAY_FILE_ALIGNMENT = 64
+
+# n-gram IDs pack (code point + 1) into this many bits per character, so
+# 0 marks padding; every code point is below 0x110000 < 2 ** 21
+NGRAM_ID_BITS = 21
+# n-grams too long to pack into 64 bits get a rolling hash instead: each
+# character is folded in, then multiplied by this odd constant and mixed
+NGRAM_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
 
-def load_data(filename: str, avg_samples_per_language: Optional[int] = None) \
-    -> Tuple[List[str], List[str]]:
+def iter_data(filename: str, samples_per_language: Optional[int] = None, seed: int = 457) \
+    -> Iterator[Tuple[str, str]]:
+    """
+    Lazily read sentence-language pairs from a .tsv file. Optionally, keep a
+    random sample of up to samples_per_language sentences for each language,
+    chosen in one pass with reservoir sampling, so that only the sample is
+    ever held in memory.
+
+    Args:
+        filename (str): the data file path
+        samples_per_language (Optional[int]): number of samples to keep for each
+            language (if None, yield every row as it is read). Defaults to None.
+        seed (int, optional): random seed for the sampling. Defaults to 457.
+
+    Yields:
+        Tuple[str, str]: (sentence, language) pairs, in file order
+    """
+    with open(filename, "r") as f:
+        datareader = csv.reader(f, delimiter="\t")
+        # skip header row
+        next(datareader)
+        if samples_per_language is None:
+            for sent, lang in datareader:
+                yield sent, lang
+            return
+
+        # reservoir sampling (algorithm R) with one reservoir per language; each
+        # reservoir holds (row number, sentence) pairs
+        rng = random.Random(seed)
+        reservoirs = {}
+        seen = Counter()
+        for i, (sent, lang) in enumerate(datareader):
+            reservoir = reservoirs.setdefault(lang, [])
+            seen[lang] += 1
+            if len(reservoir) < samples_per_language:
+                reservoir.append((i, sent))
+            else:
+                j = rng.randrange(seen[lang])
+                if j < samples_per_language:
+                    reservoir[j] = (i, sent)
+
+    samples = sorted((i, sent, lang) for lang, reservoir in reservoirs.items() for i, sent in reservoir)
+    for _, sent, lang in samples:
+        yield sent, lang
+
+
+def load_data(filename: str, avg_samples_per_language: Optional[int] = None,
+              stratified: bool = False) -> Tuple[List[str], List[str]]:
     """
     Load sentence-language pairs from a .tsv file and optionally randomly sample
     a smaller number of them
@@ -18,18 +82,19 @@ def load_data(filename: str, avg_samples_per_language: Optional[int] = None) \
         filename (str): the data file path
         avg_samples_per_language (Optional[int]): number of samples to return (if None, return all).
             Defaults to None.
+        stratified (bool, optional): sample exactly avg_samples_per_language sentences
+            of each language in one pass (see iter_data) instead of sampling from the
+            whole data set. Defaults to False.
 
     Returns:
         Tuple[List[str], List[str]]: first list is sentences, second list is languages
     """
+    if stratified and avg_samples_per_language is not None:
+        samples = list(iter_data(filename, samples_per_language=avg_samples_per_language))
+        return [sent for sent, _ in samples], [lang for _, lang in samples]
+
     # data will be initially stored as (sentence, language) tuples
-    data = []
-    with open(filename, "r") as f:
-        datareader = csv.reader(f, delimiter="\t")
-        # skip header row
-        next(datareader)
-        for row in datareader:
-            data.append(tuple(row))
+    data = list(iter_data(filename))
 
     # choose len(LANGUAGES) * avg_samples_per_language samples
     if avg_samples_per_language is not None:
@@ -45,6 +110,92 @@ def load_data(filename: str, avg_samples_per_language: Optional[int] = None) \
     return sentences, langs
 
 
+def load_data_chunks(filename: str, chunk_size: int) -> Iterator[Tuple[List[str], List[str]]]:
+    """
+    Lazily load sentence-language pairs from a .tsv file, chunk_size rows at a
+    time, so that files larger than memory can be used for training
+
+    Args:
+        filename (str): the data file path
+        chunk_size (int): maximum number of rows in each chunk
+
+    Yields:
+        Tuple[List[str], List[str]]: first list is sentences, second list is languages
+    """
+    data = iter_data(filename)
+    while True:
+        rows = list(itertools.islice(data, chunk_size))
+        if not rows:
+            break
+        yield [sent for sent, _ in rows], [lang for _, lang in rows]
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ARRAY_FILE_ALIGNMENT) * ARRAY_FILE_ALIGNMENT
+
+
+def save_arrays(filename: str, metadata: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+    """
+    Save JSON metadata and a set of NumPy arrays to a single binary file. Each
+    array is stored contiguously at an aligned offset so it can be memory mapped.
+
+    Args:
+        filename (str): the file path
+        metadata (Dict[str, Any]): JSON serializable metadata
+        arrays (Dict[str, np.ndarray]): the arrays to store, by name
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # the header records where each array starts, so it is built twice: once
+    # to find its own length, then again with the real offsets
+    layout = {name: {"dtype": array.dtype.str, "shape": list(array.shape), "offset": 0}
+              for name, array in arrays.items()}
+    for _ in range(2):
+        header = json.dumps({"metadata": metadata, "arrays": layout}).encode("utf-8")
+        offset = _align(len(ARRAY_FILE_MAGIC) + 4 + len(header) + ARRAY_FILE_ALIGNMENT)
+        for name, array in arrays.items():
+            layout[name]["offset"] = offset
+            offset = _align(offset + array.nbytes)
+    header = json.dumps({"metadata": metadata, "arrays": layout}).encode("utf-8")
+
+    with open(filename, "wb") as f:
+        f.write(ARRAY_FILE_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.write(b"\0" * (layout[name]["offset"] - f.tell()))
+            f.write(array.tobytes())
+
+
+def load_arrays(filename: str, mmap: bool = True) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """
+    Load metadata and arrays saved with save_arrays
+
+    Args:
+        filename (str): the file path
+        mmap (bool, optional): memory map the arrays (read only) instead of
+            reading them into memory. Defaults to True.
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, np.ndarray]]: the metadata and the arrays
+    """
+    with open(filename, "rb") as f:
+        assert f.read(len(ARRAY_FILE_MAGIC)) == ARRAY_FILE_MAGIC, f"{filename} is not an array file"
+        header_length, = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_length).decode("utf-8"))
+
+        arrays = {}
+        for name, layout in header["arrays"].items():
+            dtype, shape = np.dtype(layout["dtype"]), tuple(layout["shape"])
+            if mmap and math.prod(shape) > 0:
+                arrays[name] = np.memmap(filename, dtype=dtype, mode="r",
+                                         offset=layout["offset"], shape=shape)
+            else:
+                f.seek(layout["offset"])
+                arrays[name] = np.fromfile(f, dtype=dtype, count=math.prod(shape)).reshape(shape)
+    return header["metadata"], arrays
+
+
 def get_char_ngrams(string: str, n: int) -> List[str]:
     """
     Gets a list of character n-grams from a string
@@ -66,6 +217,124 @@ def get_char_ngrams(string: str, n: int) -> List[str]:
     return char_ngrams
 
 
+def get_multi_order_char_ngrams(string: str, max_n: int) -> List[List[str]]:
+    """
+    Gets the character n-grams of every order from 1 to max_n in one sweep over
+    the string. Each order follows get_char_ngrams, including its special case.
+
+    Args:
+        string (str): the string
+        max_n (int): the highest n-gram order
+
+    Returns:
+        List[List[str]]: the n-grams of each order; element n - 1 holds the n-grams
+            of order n, and its i-th n-gram starts at position i
+    """
+    ngrams_by_order = [[] for _ in range(max_n)]
+    for i in range(len(string)):
+        for n in range(1, min(max_n, len(string) - i) + 1):
+            ngrams_by_order[n - 1].append(string[i:i+n])
+    # special case: there are no n-grams because len(string) < n
+    for ngrams in ngrams_by_order:
+        if len(ngrams) == 0:
+            ngrams.append(string)
+    return ngrams_by_order
+
+
+def encode_codepoints(string: str) -> np.ndarray:
+    """
+    Encodes a string as an array of unicode code points, one per character
+
+    Args:
+        string (str): the string
+
+    Returns:
+        np.ndarray: the code points (uint32)
+    """
+    return np.frombuffer(string.encode("utf-32-le", "surrogatepass"), dtype="<u4")
+
+
+def _char_ngram_windows(strings: List[str], n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Gets the code points of every character n-gram of every string without
+    creating a string per n-gram. Follows get_char_ngrams, including the
+    special case for strings shorter than n.
+
+    Args:
+        strings (List[str]): the strings
+        n (int): the n-gram size
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: C x n matrix of code points
+            (padded with 0 for n-grams shorter than n), the length of each of
+            the C n-grams and the number of n-grams in each string
+    """
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    # pad with n zeros so that the gather below never reads past the end
+    codepoints = np.concatenate([encode_codepoints("".join(strings)), np.zeros(n, dtype="<u4")])
+
+    # strings shorter than n have one n-gram, the string itself
+    counts = np.maximum(lengths - n + 1, 1)
+    first_ngrams = np.cumsum(counts) - counts
+    starts = np.repeat(np.cumsum(lengths) - lengths, counts) \
+        + np.arange(counts.sum()) - np.repeat(first_ngrams, counts)
+    ngram_lengths = np.repeat(np.minimum(lengths, n), counts)
+
+    valid = np.arange(n) < ngram_lengths[:, None]
+    windows = np.where(valid, codepoints[starts[:, None] + np.arange(n)], 0).astype("<u4")
+    return windows, ngram_lengths, counts
+
+
+def get_char_ngram_array(strings: List[str], n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gets the character n-grams of a batch of strings as one fixed width NumPy
+    string array, built directly from the code points
+
+    Args:
+        strings (List[str]): the strings
+        n (int): the n-gram size
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the n-grams of every string, in order
+            (dtype U{n}), and the number of n-grams in each string
+    """
+    windows, _, counts = _char_ngram_windows(strings, n)
+    return windows.view(f"<U{n}").ravel(), counts
+
+
+def get_char_ngram_ids(strings: List[str], n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gets integer IDs for the character n-grams of a batch of strings. If
+    n * NGRAM_ID_BITS <= 64 (n <= 3), the ID of an n-gram packs
+    (code point + 1) of each character into NGRAM_ID_BITS bits, so IDs are
+    unique. Longer n-grams get a 64-bit rolling hash of every character
+    instead, so distinct n-grams only share an ID by (rare) collision.
+
+    Args:
+        strings (List[str]): the strings
+        n (int): the n-gram size
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the n-gram IDs of every string, in order
+            (uint64), and the number of n-grams in each string
+    """
+    windows, ngram_lengths, counts = _char_ngram_windows(strings, n)
+    ids = np.zeros(len(windows), dtype=np.uint64)
+    packed = n * NGRAM_ID_BITS <= 64
+    shift = np.uint64(1 << NGRAM_ID_BITS)
+    multiplier = np.uint64(NGRAM_HASH_MULTIPLIER)
+    for i in range(n):
+        codes = np.where(i < ngram_lengths, windows[:, i].astype(np.uint64) + np.uint64(1), np.uint64(0))
+        if packed:
+            ids = ids * shift + codes
+        else:
+            # both steps are invertible, so n-grams that differ in a single
+            # character never collide
+            ids = (ids ^ codes) * multiplier
+            ids ^= ids >> np.uint64(32)
+    return ids, counts
+
+
 def normalize(count_dict: Dict[Any, int], log_prob: bool = True) -> Dict[Any, float]:
     """
     Normalize counts in a dictionary to probabilities. Optionally, convert to log probabilities
@@ -0,0 +1,281 @@
+import array
+import json
+import math
+import os
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+
+import numpy as np
+
+
+# array files start with the magic bytes, then the little endian uint32
+# length of a JSON header, then the header and the raw array data. The same
+# format and helpers (save_arrays, load_arrays) are in hw2/util.py: each
+# homework directory is run and handed in on its own, so hw3 keeps its own
+# copy. Keep the two in sync.
+ARRAY_FILE_MAGIC = b"CS457ARR"
+ARRAY_FILE_ALIGNMENT = 64
+
+# bump when the layout of corpus caches changes, so old caches are rebuilt
+CORPUS_CACHE_VERSION = 1
+CORPUS_CACHE_SUFFIX = ".cache"
+
+
+class EncodedCorpus:
+    def __init__(self, token_vocab: List[str], tag_vocab: List[str], token_ids: np.ndarray,
+                 tag_ids: np.ndarray, offsets: np.ndarray):
+        """
+        A tagged corpus as integer arrays. Sentence i is
+        token_ids[offsets[i]:offsets[i + 1]] (and the same slice of tag_ids).
+        Iterating over it yields sentences in the format of iter_tokens,
+        decoded back to strings: the taggers look tokens up in their own
+        vocabularies, so only HMMPOSTagger.train reads the IDs directly. For
+        everything else the cache only saves parsing the text.
+
+        Args:
+            token_vocab (List[str]): token of each token ID, in order of first
+                appearance
+            tag_vocab (List[str]): tag of each tag ID, in order of first
+                appearance
+            token_ids (np.ndarray): int32 token ID of every token in the corpus
+            tag_ids (np.ndarray): int32 tag ID of every token in the corpus
+            offsets (np.ndarray): int64 start of each sentence, followed by
+                the number of tokens
+        """
+        self.token_vocab = token_vocab
+        self.tag_vocab = tag_vocab
+        self.token_ids = token_ids
+        self.tag_ids = tag_ids
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self) -> Iterator[List[Tuple[str, str]]]:
+        token_vocab, tag_vocab = self.token_vocab, self.tag_vocab
+        token_ids, tag_ids = self.token_ids.tolist(), self.tag_ids.tolist()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield [(token_vocab[token], tag_vocab[tag])
+                   for token, tag in zip(token_ids[start:end], tag_ids[start:end])]
+
+
+# a corpus: a path, an open file, or several of them (shards) read in order,
+# or an EncodedCorpus
+CorpusSource = Union[str, os.PathLike, TextIO, Iterable[Union[str, os.PathLike, TextIO]], EncodedCorpus]
+
+
+def iter_tokens(source: CorpusSource) -> Iterator[List[Tuple[str, str]]]:
+    """
+    Lazily read the tokens and tags of a corpus, one sentence at a time.
+    The files are expected to have sentences separated by newline; blank
+    lines are skipped. Each sentence is formatted as
+    token1/tag1 token2/tag2 ... tokenn/tagn
+
+    Args:
+        source (CorpusSource): path to a file with the given format, an open
+            file, a list of paths/open files (shards) to read in order, or an
+            EncodedCorpus
+
+    Yields:
+        List[Tuple[str, str]]: (token, tag) pairs of the next sentence
+    """
+    if isinstance(source, EncodedCorpus):
+        yield from source
+        return
+    if isinstance(source, (str, os.PathLike)) or hasattr(source, "read"):
+        source = [source]
+    for shard in source:
+        if hasattr(shard, "read"):
+            yield from _parse_lines(shard)
+        else:
+            with open(shard) as f:
+                yield from _parse_lines(f)
+
+
+def _parse_lines(lines: Iterable[str]) -> Iterator[List[Tuple[str, str]]]:
+    """
+    Args:
+        lines (Iterable[str]): lines in the format accepted by iter_tokens
+
+    Yields:
+        List[Tuple[str, str]]: (token, tag) pairs of each non-blank line
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        tokens = []
+        for token_tag_pair in line.split(" "):
+            # str.rsplit("/", 1) returns splits once based on the last
+            # occurrence of / this is important if the token has / in it
+            token, tag = token_tag_pair.strip().rsplit("/", 1)
+            tokens.append((token, tag))
+        yield tokens
+
+
+def get_tokens(file_path: CorpusSource) -> List[List[Tuple[str, str]]]:
+    """
+    Get the tokens and tags from a file.
+    The file is expected to have sentences separated by newline.
+    Each sentence is formatted as token1/tag1 token2/tag2 ... tokenn tagn
+
+    Args:
+        file_path (CorpusSource): path to a file with the given format, or
+            any other source accepted by iter_tokens
+
+    Returns:
+        List[List[Tuple[str, str]]]: outer list represents sentences,
+            inner list is tuples of (token, tag) pairs
+    """
+    return list(iter_tokens(file_path))
+
+
+def encode_corpus(source: CorpusSource) -> EncodedCorpus:
+    """
+    Encode a corpus as integer arrays in one pass
+
+    Args:
+        source (CorpusSource): any source accepted by iter_tokens
+
+    Returns:
+        EncodedCorpus: the encoded corpus
+    """
+    token_index, tag_index = {}, {}
+    token_ids, tag_ids = array.array("i"), array.array("i")
+    offsets = array.array("q", [0])
+    for sentence in iter_tokens(source):
+        for token, tag in sentence:
+            token_ids.append(token_index.setdefault(token, len(token_index)))
+            tag_ids.append(tag_index.setdefault(tag, len(tag_index)))
+        offsets.append(len(token_ids))
+    return EncodedCorpus(list(token_index), list(tag_index), np.frombuffer(token_ids, dtype=np.int32),
+                         np.frombuffer(tag_ids, dtype=np.int32), np.frombuffer(offsets, dtype=np.int64))
+
+
+def _source_stamp(file_path: str) -> Dict[str, Any]:
+    """
+    Args:
+        file_path (str): path to a corpus file
+
+    Returns:
+        Dict[str, Any]: what a cache of the file is checked against
+    """
+    stat = os.stat(file_path)
+    return {"version": CORPUS_CACHE_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_corpus(file_path: str, cache_path: Optional[str] = None) -> EncodedCorpus:
+    """
+    Load a tagged corpus file through its binary cache: the cache is memory
+    mapped if it is up to date with the file, and (re)built otherwise. A
+    cache is up to date if the file's size and modification time match the
+    ones recorded when the cache was built.
+
+    Args:
+        file_path (str): path to a file in the format accepted by iter_tokens
+        cache_path (Optional[str], optional): where to keep the cache.
+            Defaults to file_path + CORPUS_CACHE_SUFFIX.
+
+    Returns:
+        EncodedCorpus: the encoded corpus
+    """
+    if cache_path is None:
+        cache_path = file_path + CORPUS_CACHE_SUFFIX
+    stamp = _source_stamp(file_path)
+    if os.path.exists(cache_path):
+        try:
+            metadata, arrays = load_arrays(cache_path)
+        except (AssertionError, KeyError, ValueError, struct.error):
+            # not a cache file or a truncated one: rebuild it below
+            metadata = None
+        if metadata is not None and metadata.get("source") == stamp:
+            return EncodedCorpus(metadata["token_vocab"], metadata["tag_vocab"], arrays["token_ids"],
+                                 arrays["tag_ids"], arrays["offsets"])
+
+    corpus = encode_corpus(file_path)
+    # write to a temporary file first, so that a reader never sees half a cache
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    save_arrays(temp_path, {
+        "source": stamp,
+        "token_vocab": corpus.token_vocab,
+        "tag_vocab": corpus.tag_vocab,
+    }, {
+        "token_ids": corpus.token_ids,
+        "tag_ids": corpus.tag_ids,
+        "offsets": corpus.offsets,
+    })
+    os.replace(temp_path, cache_path)
+    return corpus
+
+
+def _align(offset: int) -> int:
+    """
+    Args:
+        offset (int): a file offset
+
+    Returns:
+        int: the offset rounded up to a multiple of ARRAY_FILE_ALIGNMENT
+    """
+    return -(-offset // ARRAY_FILE_ALIGNMENT) * ARRAY_FILE_ALIGNMENT
+
+
+def save_arrays(filename: str, metadata: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+    """
+    Save JSON metadata and a set of NumPy arrays to a single binary file. Each
+    array is stored contiguously at an aligned offset so it can be memory mapped.
+
+    Args:
+        filename (str): the file path
+        metadata (Dict[str, Any]): JSON serializable metadata
+        arrays (Dict[str, np.ndarray]): the arrays to store, by name
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # the header records where each array starts, so it is built twice: once
+    # to find its own length, then again with the real offsets
+    layout = {name: {"dtype": array.dtype.str, "shape": list(array.shape), "offset": 0}
+              for name, array in arrays.items()}
+    for _ in range(2):
+        header = json.dumps({"metadata": metadata, "arrays": layout}).encode("utf-8")
+        offset = _align(len(ARRAY_FILE_MAGIC) + 4 + len(header) + ARRAY_FILE_ALIGNMENT)
+        for name, array in arrays.items():
+            layout[name]["offset"] = offset
+            offset = _align(offset + array.nbytes)
+    header = json.dumps({"metadata": metadata, "arrays": layout}).encode("utf-8")
+
+    with open(filename, "wb") as f:
+        f.write(ARRAY_FILE_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.write(b"\0" * (layout[name]["offset"] - f.tell()))
+            f.write(array.tobytes())
+
+
+def load_arrays(filename: str, mmap: bool = True) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """
+    Load metadata and arrays saved with save_arrays
+
+    Args:
+        filename (str): the file path
+        mmap (bool, optional): memory map the arrays (read only) instead of
+            reading them into memory. Defaults to True.
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, np.ndarray]]: the metadata and the arrays
+    """
+    with open(filename, "rb") as f:
+        assert f.read(len(ARRAY_FILE_MAGIC)) == ARRAY_FILE_MAGIC, f"{filename} is not an array file"
+        header_length, = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_length).decode("utf-8"))
+
+        arrays = {}
+        for name, layout in header["arrays"].items():
+            dtype, shape = np.dtype(layout["dtype"]), tuple(layout["shape"])
+            if mmap and math.prod(shape) > 0:
+                arrays[name] = np.memmap(filename, dtype=dtype, mode="r",
+                                         offset=layout["offset"], shape=shape)
+            else:
+                f.seek(layout["offset"])
+                arrays[name] = np.fromfile(f, dtype=dtype, count=math.prod(shape)).reshape(shape)
+    return header["metadata"], arrays
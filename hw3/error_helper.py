@@ -1,13 +1,16 @@
+import argparse
 import json
 import os
-from random import shuffle
-from typing import List
+import random
+from typing import Iterable, List, Optional, TypeVar
 
-from model import PREDICTIONS_FILENAME
+from model import ERROR_INDEX_FILENAME, PREDICTIONS_FILENAME, error_pair_key
 
 
 PRINT_NUM = 5
 
+T = TypeVar("T")
+
 
 def print_predictions(tokens: List[str], golden_tags: List[str],
                       predicted_tags: List[str]):
@@ -25,18 +28,126 @@ def print_predictions(tokens: List[str], golden_tags: List[str],
     print("\n")
 
 
+def reservoir_sample(items: Iterable[T], num: int, rng: random.Random) -> List[T]:
+    """
+    Sample items uniformly without replacement in a single pass, keeping at
+    most num of them in memory (reservoir sampling)
+
+    Args:
+        items (Iterable[T]): the items to sample from
+        num (int): number of items to sample
+        rng (random.Random): source of randomness
+
+    Returns:
+        List[T]: num items (all of them if there are fewer), in random order
+    """
+    sample = []
+    for i, item in enumerate(items):
+        if i < num:
+            sample.append(item)
+        else:
+            j = rng.randrange(i + 1)
+            if j < num:
+                sample[j] = item
+    rng.shuffle(sample)
+    return sample
+
+
+def has_error(golden_tags: List[str], predicted_tags: List[str],
+              golden: Optional[str], predicted: Optional[str]) -> bool:
+    """
+    Args:
+        golden_tags (List[str]): the actual POS tags
+        predicted_tags (List[str]): the predicted POS tags
+        golden (Optional[str]): the actual tag of the error, or None for any
+        predicted (Optional[str]): the predicted tag of the error, or None
+            for any
+
+    Returns:
+        bool: whether some token is tagged incorrectly with these tags
+    """
+    return any(actual != guess and golden in (None, actual) and predicted in (None, guess)
+               for actual, guess in zip(golden_tags, predicted_tags))
+
+
+def indexed_offsets(golden: Optional[str], predicted: Optional[str]) -> List[int]:
+    """
+    Look up the sentences with an error in ERROR_INDEX_FILENAME
+
+    Args:
+        golden (Optional[str]): the actual tag of the error, or None for any
+        predicted (Optional[str]): the predicted tag of the error, or None
+            for any
+
+    Returns:
+        List[int]: byte offsets in PREDICTIONS_FILENAME of the sentences
+    """
+    with open(ERROR_INDEX_FILENAME, "r") as f:
+        error_offsets = json.load(f)
+    if golden is not None and predicted is not None:
+        return error_offsets.get(error_pair_key(golden, predicted), [])
+    # a sentence can have several matching errors
+    offsets = set()
+    for key, key_offsets in error_offsets.items():
+        actual, guess = key.split(" ")
+        if golden in (None, actual) and predicted in (None, guess):
+            offsets.update(key_offsets)
+    return sorted(offsets)
+
+
 def main():
     """
-    Read predictions file and print 5 random incorrect predictions
+    Read predictions file and print random incorrect predictions, optionally
+    only those with a given error. For example:
+        python error_helper.py --golden NOUN --predicted PROPN
+    Filtering by error uses the index written by predict(error_index=True)
+    if there is one, and otherwise reads the whole predictions file.
     """
-    if os.path.exists(PREDICTIONS_FILENAME):
-        with open(PREDICTIONS_FILENAME, "r") as f:
-            predictions = json.load(f)
-        shuffle(predictions)
-        for tokens, golden_tags, predicted_tags in predictions[:PRINT_NUM]:
-            print_predictions(tokens, golden_tags, predicted_tags)
-    else:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--num",
+        default=PRINT_NUM,
+        type=int,
+        help="Number of incorrect predictions to print")
+    parser.add_argument(
+        "--golden",
+        type=str,
+        help="Only print sentences where a token with this actual tag is tagged incorrectly")
+    parser.add_argument(
+        "--predicted",
+        type=str,
+        help="Only print sentences where a token is incorrectly tagged with this tag")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Random seed for the sample")
+    args = parser.parse_args()
+
+    if not os.path.exists(PREDICTIONS_FILENAME):
         print(f"No {PREDICTIONS_FILENAME} file - have you run test.py?")
+        return
+
+    rng = random.Random(args.seed)
+    filtered = args.golden is not None or args.predicted is not None
+    with open(PREDICTIONS_FILENAME, "rb") as f:
+        if filtered and os.path.exists(ERROR_INDEX_FILENAME):
+            predictions = []
+            for offset in reservoir_sample(indexed_offsets(args.golden, args.predicted), args.num, rng):
+                f.seek(offset)
+                predictions.append(json.loads(f.readline()))
+        elif filtered:
+            predictions = reservoir_sample(
+                (prediction for prediction in map(json.loads, f)
+                 if has_error(prediction[1], prediction[2], args.golden, args.predicted)),
+                args.num, rng)
+        else:
+            # only the sampled lines need to be parsed
+            predictions = [json.loads(line) for line in reservoir_sample(f, args.num, rng)]
+
+    if filtered and not predictions:
+        print("No incorrect predictions with that error")
+    for tokens, golden_tags, predicted_tags in predictions:
+        print_predictions(tokens, golden_tags, predicted_tags)
 
 
 if __name__ == "__main__":
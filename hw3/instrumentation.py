@@ -0,0 +1,155 @@
+import contextlib
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, TypeVar
+
+
+# sentence lengths are grouped into buckets of this many tokens in the decode
+# latency histogram
+LATENCY_BUCKET_WIDTH = 10
+
+T = TypeVar("T")
+
+# marks the end of the items in TaggerStats.timed
+_END = object()
+
+
+class TaggerStats:
+    def __init__(self):
+        """
+        Timings and counters recorded by an instrumented tagger (see
+        POSTagger.instrument). Phases are timed exclusively: when phases are
+        nested, e.g. parsing while counting, the inner phase's time is not
+        counted again in the outer one.
+        """
+        # phase --> seconds
+        self.phase_seconds = Counter()
+        # decoded sentences and tokens, and lattice cells (previous state,
+        # state) evaluated while decoding them
+        self.sentences = 0
+        self.tokens = 0
+        self.cells = 0
+        # length bucket --> [sentences, total seconds, most seconds]
+        self.latency = {}
+        # time spent in nested phases, for each open phase
+        self._nested_seconds = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Time the body of a with statement as the given phase
+
+        Args:
+            name (str): the phase
+        """
+        start = time.perf_counter()
+        self._nested_seconds.append(0.0)
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.phase_seconds[name] += seconds - self._nested_seconds.pop()
+            if self._nested_seconds:
+                self._nested_seconds[-1] += seconds
+
+    def timed(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        """
+        Time getting each item of a lazy iterable as the given phase
+
+        Args:
+            name (str): the phase
+            items (Iterable[T]): e.g. the sentences yielded by iter_tokens
+
+        Yields:
+            T: the items
+        """
+        items = iter(items)
+        while True:
+            with self.phase(name):
+                item = next(items, _END)
+            if item is _END:
+                return
+            yield item
+
+    def record_decode(self, lengths: List[int], seconds: float):
+        """
+        Record sentences decoded together. Each sentence is counted as taking
+        a share of the time proportional to its number of tokens, as the
+        decoder does one lattice step per token.
+
+        Args:
+            lengths (List[int]): length of each sentence
+            seconds (float): time taken to decode them
+        """
+        self.sentences += len(lengths)
+        self.tokens += sum(lengths)
+        total_length = sum(lengths)
+        for length in lengths:
+            share = seconds * length / total_length if total_length else seconds / len(lengths)
+            bucket = self.latency.setdefault(max(length - 1, 0) // LATENCY_BUCKET_WIDTH, [0, 0.0, 0.0])
+            bucket[0] += 1
+            bucket[1] += share
+            bucket[2] = max(bucket[2], share)
+
+    def merge(self, other: "TaggerStats"):
+        """
+        Add the timings and counters of other, e.g. recorded by a worker process
+
+        Args:
+            other (TaggerStats): the stats to add
+        """
+        self.phase_seconds.update(other.phase_seconds)
+        self.sentences += other.sentences
+        self.tokens += other.tokens
+        self.cells += other.cells
+        for key, (sentences, seconds, most_seconds) in other.latency.items():
+            bucket = self.latency.setdefault(key, [0, 0.0, 0.0])
+            bucket[0] += sentences
+            bucket[1] += seconds
+            bucket[2] = max(bucket[2], most_seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: seconds per phase, decoded sentences, tokens and
+                lattice cells, throughput (per second of the decode phase)
+                and the decode latency histogram: the number of sentences and
+                mean/max milliseconds per sentence, by sentence length. A
+                sentence decoded in a batch is counted as taking the share of
+                the batch's time that its tokens are of the batch's tokens
+                (see record_decode)
+        """
+        decode_seconds = self.phase_seconds["decode"]
+        return {
+            "phase_seconds": dict(self.phase_seconds),
+            "sentences": self.sentences,
+            "tokens": self.tokens,
+            "cells": self.cells,
+            "sentences_per_second": self.sentences / decode_seconds if decode_seconds else None,
+            "tokens_per_second": self.tokens / decode_seconds if decode_seconds else None,
+            "latency_by_length": [{
+                "min_length": key * LATENCY_BUCKET_WIDTH + 1,
+                "max_length": (key + 1) * LATENCY_BUCKET_WIDTH,
+                "sentences": sentences,
+                "mean_ms": seconds / sentences * 1000,
+                "max_ms": most_seconds * 1000,
+            } for key, (sentences, seconds, most_seconds) in sorted(self.latency.items())],
+        }
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: the stats formatted for printing
+        """
+        stats = self.as_dict()
+        lines = ["Phase times: " + ", ".join(
+            f"{name} {seconds:.3f}s" for name, seconds in stats["phase_seconds"].items())]
+        if stats["tokens_per_second"] is not None:
+            lines.append(f"Decoded {stats['sentences']} sentences ({stats['sentences_per_second']:.1f}/s), "
+                         f"{stats['tokens']} tokens ({stats['tokens_per_second']:.1f}/s), "
+                         f"{stats['cells']} lattice cells")
+            lines.append(f"{'length':>9} | {'sentences':>9} | {'mean ms':>8} | {'max ms':>8}")
+            for bucket in stats["latency_by_length"]:
+                lines.append(f"{bucket['min_length']:>4}-{bucket['max_length']:<4} | {bucket['sentences']:>9} | "
+                             f"{bucket['mean_ms']:>8.3f} | {bucket['max_ms']:>8.3f}")
+        return "\n".join(lines)
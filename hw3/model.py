@@ -1,40 +1,137 @@
 import abc
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, deque
+import contextlib
 import itertools
 import json
 import math
+import multiprocessing
+import multiprocessing.pool
+import os
 import random
-from typing import Dict, List, Set, Tuple
+import time
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+import numpy as np
 
-PREDICTIONS_FILENAME = "predicted_tags.json"
+from corpus import CorpusSource, EncodedCorpus, get_tokens, iter_tokens, load_arrays, save_arrays
+from instrumentation import TaggerStats
+
+
+# incorrectly tagged sentences, one JSON [tokens, golden tags, predicted tags]
+# list per line
+PREDICTIONS_FILENAME = "predicted_tags.jsonl"
+# maps error_pair_key(golden tag, predicted tag) to the byte offsets of the
+# lines of PREDICTIONS_FILENAME with that error
+ERROR_INDEX_FILENAME = "predicted_tags.index.json"
 UNK_TOKEN = "<UNK>"
+# number of sentences decoded together by predict_batch
+BATCH_SIZE = 512
+# number of sentences predict reads and tags at a time; several batches, so
+# that sorting a chunk by length still gives batches of similar lengths
+PREDICT_CHUNK_SIZE = 8 * BATCH_SIZE
+
+# bump when the layout of saved taggers changes
+MODEL_FORMAT_VERSION = 1
+
+def _load_tagger_arrays(cls: type, path: str, mmap: bool) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """
+    Read a tagger file written by save, checking that it holds a cls tagger
+    in the current format
 
+    Args:
+        cls (type): the tagger class
+        path (str): the file path
+        mmap (bool): memory map the arrays
 
-def get_tokens(file_path: str) -> List[List[Tuple[str, str]]]:
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, np.ndarray]]: the metadata and the arrays
     """
-    Get the tokens and tags from a file.
-    The file is expected to have sentences separated by newline.
-    Each sentence is formatted as token1/tag1 token2/tag2 ... tokenn tagn
+    metadata, arrays = load_arrays(path, mmap=mmap)
+    assert metadata.get("format") == cls.__name__, f"{path} does not hold a {cls.__name__}"
+    assert metadata["version"] == MODEL_FORMAT_VERSION, \
+        f"{path} uses model format version {metadata['version']}, expected {MODEL_FORMAT_VERSION}"
+    return metadata, arrays
+
 
+def error_pair_key(golden_tag: str, predicted_tag: str) -> str:
+    """
     Args:
-        file_path (str): path to a file with the given format
+        golden_tag (str): the actual POS tag
+        predicted_tag (str): the predicted POS tag
+
+    Returns:
+        str: the key of the error in ERROR_INDEX_FILENAME
+    """
+    # tags never contain spaces, as sentences are split on them
+    return f"{golden_tag} {predicted_tag}"
 
+
+# the tagger used by worker processes, set once by the pool initializer
+_worker_tagger = None
+
+
+def _worker_context() -> multiprocessing.context.BaseContext:
+    """
     Returns:
-        List[List[Tuple[str, str]]]: outer list represents sentences,
-            inner list is tuples of (token, tag) pairs
+        multiprocessing.context.BaseContext: the fork context where it is
+            available. A forked worker has the parent's copy of the tagger,
+            including the iteration order of HMMPOSTagger._tags, which the
+            dictionary decoder breaks ties and picks its <UNK> fallback by. A
+            spawned worker would rebuild the set in its own hash order (as on
+            Windows, where use compiled=True for the same tags as one process)
     """
-    sentences = []
-    with open(file_path) as f:
-        for line in f.readlines():
-            tokens = []
-            for token_tag_pair in line.split(" "):
-                # str.rsplit("/", 1) returns splits once based on the last
-                # occurrence of / this is important if the token has / in it
-                token, tag = token_tag_pair.strip().rsplit("/", 1)
-                tokens.append((token, tag))
-            sentences.append(tokens)
-    return sentences
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def _init_worker(tagger: "POSTagger"):
+    global _worker_tagger
+    _worker_tagger = tagger
+
+
+def _score_chunk(sentences: List[List[Tuple[str, str]]]) \
+    -> Tuple[Tuple[int, int, List[Tuple[List[str], List[str], List[str]]]], Optional[TaggerStats]]:
+    """
+    Tag one chunk of the test set with the worker's tagger. Defined at module
+    level so that worker processes can run it.
+
+    Args:
+        sentences (List[List[Tuple[str, str]]]): sentences in the format
+            returned by get_tokens
+
+    Returns:
+        Tuple[Tuple[int, int, List[Tuple[List[str], List[str], List[str]]]], Optional[TaggerStats]]:
+            the result of POSTagger._score and, if the tagger is
+            instrumented, the stats recorded while tagging the chunk
+    """
+    if _worker_tagger.stats is not None:
+        # only send back what this chunk adds
+        _worker_tagger.stats = TaggerStats()
+    return _worker_tagger._score(sentences), _worker_tagger.stats
+
+
+def _imap_bounded(pool: multiprocessing.pool.Pool, func: Callable, items: Iterable, window: int) -> Iterator:
+    """
+    Like pool.imap, but items are only taken from the iterable (in the calling
+    thread) while fewer than window of them are being processed
+
+    Args:
+        pool (multiprocessing.pool.Pool): the worker pool
+        func (Callable): a module level function of one item
+        items (Iterable): the items
+        window (int): the most items processed or waiting at a time
+
+    Yields:
+        the result of func for each item, in order
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
 
 
 class POSTagger(abc.ABC):
@@ -43,65 +140,207 @@ class POSTagger(abc.ABC):
         Initialize a POS tagger object
         """
         self._trained = False
+        # set by instrument
+        self.stats = None
         random.seed(457)
 
-    def train(self, train_data_path: str):
+    def instrument(self) -> TaggerStats:
+        """
+        Start recording the time spent parsing, counting, smoothing,
+        compiling, decoding and writing errors, and decoding throughput,
+        lattice cells and latency. Off by default.
+
+        Returns:
+            TaggerStats: the stats, also available as self.stats
+        """
+        self.stats = TaggerStats()
+        return self.stats
+
+    def _phase(self, name: str):
+        """
+        Args:
+            name (str): the phase
+
+        Returns:
+            a context manager timing its body as the phase if instrumented
+        """
+        return self.stats.phase(name) if self.stats is not None else contextlib.nullcontext()
+
+    def _iter_tokens(self, source: CorpusSource) -> Iterator[List[Tuple[str, str]]]:
+        """
+        iter_tokens, timed as the "parse" phase if instrumented
+
+        Args:
+            source (CorpusSource): any source accepted by iter_tokens
+
+        Returns:
+            Iterator[List[Tuple[str, str]]]: (token, tag) pairs of each sentence
+        """
+        sentences = iter_tokens(source)
+        return self.stats.timed("parse", sentences) if self.stats is not None else sentences
+
+    def _count_cells(self, cells: int):
+        """
+        Args:
+            cells (int): lattice cells evaluated by a decoder, recorded if
+                instrumented
+        """
+        if self.stats is not None:
+            self.stats.cells += cells
+
+    def train(self, train_data_path: CorpusSource):
         """
         Should be overridden by child classes - sets self._trained to true to
         indicate that the model can be used for prediction
 
         Args:
-            train_data_path (str): path to test data, format should be the
-                format accepted by get_tokens
+            train_data_path (CorpusSource): path to training data, format
+                should be the format accepted by iter_tokens
         """
         self._trained = True
 
-    def predict(self, test_data_path: str, report_accuracy: bool = True,
-                save_results: bool = True) -> float:
+    def predict(self, test_data_path: CorpusSource, report_accuracy: bool = True,
+                save_results: bool = True, n_jobs: int = 1,
+                error_index: bool = False) -> float:
         """
         Method to predict POS tags from a test set and calculate tag-level
-        accuracy
+        accuracy. The test set is read and tagged PREDICT_CHUNK_SIZE sentences
+        at a time (fewer if that would leave some of the n_jobs workers
+        without a chunk), and incorrectly tagged sentences are written out as
+        they are found, so memory use does not grow with the size of the test
+        set.
 
         Args:
-            test_data_path (str): path to test data, format should be the
-                format accepted by get_tokens
+            test_data_path (CorpusSource): path to test data, format should
+                be the format accepted by iter_tokens
             report_accuracy (bool, optional): print the tag-level accuracy
                 score. Defaults to True.
             save_results (bool, optional): save the results of incorrectly
-                predicted sentences as a json file. Defaults to True.
+                predicted sentences to PREDICTIONS_FILENAME as JSON lines.
+                Defaults to True.
+            n_jobs (int, optional): number of worker processes that tag the
+                chunks of the test set (-1 for all cores). Each worker
+                receives the tagger once. Defaults to 1.
+            error_index (bool, optional): also save ERROR_INDEX_FILENAME,
+                which finds the saved sentences by (golden tag, predicted
+                tag) error. Defaults to False.
 
         Returns:
             float: the tag-level accuracy
         """
         self.check_trained()
-        test_sentences = get_tokens(test_data_path)
+        assert n_jobs >= 1 or n_jobs == -1, "n_jobs must be at least 1, or -1 for all cores"
+        sentences = self._iter_tokens(test_data_path)
+        n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        chunk_size = PREDICT_CHUNK_SIZE
+        if n_jobs > 1:
+            # a test set with less than a chunk per worker is split evenly
+            # between the workers instead of going to the first few
+            head = list(itertools.islice(sentences, n_jobs * PREDICT_CHUNK_SIZE))
+            chunk_size = min(PREDICT_CHUNK_SIZE, max(1, math.ceil(len(head) / n_jobs)))
+            sentences = itertools.chain(head, sentences)
+        chunks = iter(lambda: list(itertools.islice(sentences, chunk_size)), [])
+
+        correct = 0
+        total = 0
+        error_offsets = defaultdict(list) if error_index else None
+        with contextlib.ExitStack() as stack:
+            if n_jobs > 1:
+                pool = stack.enter_context(_worker_context().Pool(
+                    n_jobs, initializer=_init_worker, initargs=(self,)))
+                # the chunks come back in order, so the results are the same
+                # as a single pass. Unlike pool.imap, the chunks are read in
+                # this thread, so parse timing nests in the decode phase
+                chunk_results = _imap_bounded(pool, _score_chunk, chunks, 2 * n_jobs)
+            else:
+                chunk_results = ((self._score(chunk), None) for chunk in chunks)
+
+            # save incorrect tags in a file as they come in
+            errors_file = None
+            if save_results:
+                # an index left by an earlier run would not match the new file
+                if os.path.exists(ERROR_INDEX_FILENAME):
+                    os.remove(ERROR_INDEX_FILENAME)
+                errors_file = stack.enter_context(open(PREDICTIONS_FILENAME, "wb"))
+
+            # with n_jobs > 1, the decode phase is the time spent waiting
+            # for the workers
+            with self._phase("decode"):
+                for (chunk_correct, chunk_total, chunk_incorrect), chunk_stats in chunk_results:
+                    correct += chunk_correct
+                    total += chunk_total
+                    if chunk_stats is not None:
+                        self.stats.merge(chunk_stats)
+                    if errors_file is not None:
+                        with self._phase("write_errors"):
+                            self._write_errors(errors_file, chunk_incorrect, error_offsets)
 
+        accuracy = correct / total
+        if report_accuracy:
+            print("Tag level accuracy: {0:.2%}".format(accuracy))
+
+        if save_results and error_index:
+            with self._phase("write_errors"), open(ERROR_INDEX_FILENAME, "w") as f:
+                json.dump(error_offsets, f)
+
+        return accuracy
+
+    @staticmethod
+    def _write_errors(errors_file: BinaryIO,
+                      incorrect: List[Tuple[List[str], List[str], List[str]]],
+                      error_offsets: Optional[Dict[str, List[int]]]):
+        """
+        Append incorrectly tagged sentences to the predictions file
+
+        Args:
+            errors_file (BinaryIO): PREDICTIONS_FILENAME, open for writing
+            incorrect (List[Tuple[List[str], List[str], List[str]]]): the
+                (tokens, golden tags, predicted tags) of the sentences
+            error_offsets (Optional[Dict[str, List[int]]]): if given, the
+                offset of each sentence's line is added under each of its
+                errors' error_pair_key
+        """
+        for sentence in incorrect:
+            if error_offsets is not None:
+                _, golden_tags, predicted_tags = sentence
+                offset = errors_file.tell()
+                for golden, predicted in sorted(set(zip(golden_tags, predicted_tags))):
+                    if golden != predicted:
+                        error_offsets[error_pair_key(golden, predicted)].append(offset)
+            errors_file.write(json.dumps(sentence).encode("utf-8") + b"\n")
+
+    def _score(self, sentences: List[List[Tuple[str, str]]]) \
+        -> Tuple[int, int, List[Tuple[List[str], List[str], List[str]]]]:
+        """
+        Tag sentences and compare the tags with the golden tags
+
+        Args:
+            sentences (List[List[Tuple[str, str]]]): sentences in the format
+                returned by get_tokens
+
+        Returns:
+            Tuple[int, int, List[Tuple[List[str], List[str], List[str]]]]:
+                number of correct tags, total number of tags and the (tokens,
+                golden tags, predicted tags) of the incorrectly tagged
+                sentences
+        """
         correct = 0
         total = 0
         incorrect = []
-        for sentence in test_sentences:
+        all_predicted_tags = self.predict_batch(
+            [[token for token, _ in sentence] for sentence in sentences])
+        for sentence, predicted_tags in zip(sentences, all_predicted_tags):
             # separate tags from tokens
             tokens = [token for token, _ in sentence]
             golden_tags = [tag for _, tag in sentence]
-            # predict and update results
-            predicted_tags = self.predict_one(tokens)
+            # update results
             correct += sum(1 for correct, predicted in
                            zip(golden_tags, predicted_tags)
                            if correct == predicted)
             total += len(golden_tags)
             if golden_tags != predicted_tags:
                 incorrect.append((tokens, golden_tags, predicted_tags))
-
-        accuracy = correct / total
-        if report_accuracy:
-            print("Tag level accuracy: {0:.2%}".format(accuracy))
-
-        # save tags in a file
-        if save_results:
-            with open(PREDICTIONS_FILENAME, "w") as f:
-                json.dump(incorrect, f)
-
-        return accuracy
+        return correct, total, incorrect
 
     @abc.abstractmethod
     def predict_one(self, tokens: List[str]) -> List[str]:
@@ -116,6 +355,30 @@ class POSTagger(abc.ABC):
         """
         pass
 
+    def predict_batch(self, sentences: List[List[str]],
+                      batch_size: int = BATCH_SIZE) -> List[List[str]]:
+        """
+        Predict tag sequences for many sentences. Child classes can override
+        this to decode several sentences at once; by default it calls
+        predict_one on each sentence
+
+        Args:
+            sentences (List[List[str]]): a list of token lists
+            batch_size (int, optional): number of sentences decoded together.
+                Defaults to BATCH_SIZE.
+
+        Returns:
+            List[List[str]]: tags for each token of each sentence
+        """
+        if self.stats is None:
+            return [self.predict_one(tokens) for tokens in sentences]
+        predictions = []
+        for tokens in sentences:
+            start = time.perf_counter()
+            predictions.append(self.predict_one(tokens))
+            self.stats.record_decode([len(tokens)], time.perf_counter() - start)
+        return predictions
+
     def check_trained(self):
         """
         Checks if the model has been trained before predicting.
@@ -137,28 +400,70 @@ class BaselinePOSTagger(POSTagger):
         self._token_to_tag = None
         self._tags = Counter()
 
-    def train(self, train_data_path: str):
+    def train(self, train_data_path: CorpusSource):
         """
         Train POS tagger, saving the most probable token for each tag and
-        counts of tags
+        counts of tags. The corpus is read lazily in a single pass.
 
         Args:
-            train_data_path (str): path to test data, format should be the
-                format accepted by get_tokens
+            train_data_path (CorpusSource): path to training data, format
+                should be the format accepted by iter_tokens
         """
         super().train(train_data_path)
-        sentences = get_tokens(train_data_path)
         token_tag_counts = defaultdict(Counter)
-        for sentence in sentences:
-            for token, tag in sentence:
-                token_tag_counts[token][tag] += 1
-                self._tags[tag] += 1
+        with self._phase("count"):
+            for sentence in self._iter_tokens(train_data_path):
+                for token, tag in sentence:
+                    token_tag_counts[token][tag] += 1
+                    self._tags[tag] += 1
+
+            self._token_to_tag = {}
+            for token, token_counts in token_tag_counts.items():
+                # Counter.most_common(k) returns a list of tuples ordered by count
+                # the tuple format is (key, count)
+                self._token_to_tag[token] = token_counts.most_common(1)[0][0]
+
+    def save(self, path: str):
+        """
+        Save the trained tagger to a single binary file: the tags and their
+        counts, and the index of each token's most common tag
 
-        self._token_to_tag = {}
-        for token, token_counts in token_tag_counts.items():
-            # Counter.most_common(k) returns a list of tuples ordered by count
-            # the tuple format is (key, count)
-            self._token_to_tag[token] = token_counts.most_common(1)[0][0]
+        Args:
+            path (str): the file path
+        """
+        self.check_trained()
+        tags = list(self._tags)
+        tag_index = {tag: i for i, tag in enumerate(tags)}
+        save_arrays(path, {
+            "format": type(self).__name__,
+            "version": MODEL_FORMAT_VERSION,
+            "tags": tags,
+            "tokens": list(self._token_to_tag),
+        }, {
+            "tag_counts": np.array(list(self._tags.values()), dtype=np.int64),
+            "token_tags": np.array([tag_index[tag] for tag in self._token_to_tag.values()], dtype=np.int32),
+        })
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "BaselinePOSTagger":
+        """
+        Load a tagger written by save
+
+        Args:
+            path (str): the file path
+            mmap (bool, optional): memory map the arrays. Defaults to True.
+
+        Returns:
+            BaselinePOSTagger: the loaded tagger
+        """
+        metadata, arrays = _load_tagger_arrays(cls, path, mmap)
+        tagger = cls()
+        tags = metadata["tags"]
+        # Counter keeps the saved order, so most_common breaks ties the same way
+        tagger._tags = Counter(dict(zip(tags, arrays["tag_counts"].tolist())))
+        tagger._token_to_tag = dict(zip(metadata["tokens"], [tags[i] for i in arrays["token_tags"].tolist()]))
+        tagger._trained = True
+        return tagger
 
     def predict_one(self, tokens: List[str]):
         """
@@ -187,7 +492,11 @@ class BaselinePOSTagger(POSTagger):
 
 class HMMPOSTagger(POSTagger):
     def __init__(self, k_transition: float = .01,
-                 k_emission: float = .01, extension: bool = False):
+                 k_emission: float = .01, extension: bool = False,
+                 compiled: bool = False, beam_width: Optional[int] = None,
+                 beam_threshold: Optional[float] = None,
+                 tag_dictionary_min_count: Optional[int] = None,
+                 unknown_tags: str = "all"):
         """
         Initialize a HMMPOSTagger
 
@@ -199,11 +508,37 @@ class HMMPOSTagger(POSTagger):
                 laplace smoothing of the emission probabilities. Defaults to 1.
             extension (bool, optional): use an extension that weights emission
                 smoothing. Defaults to False.
+            compiled (bool, optional): index the log probabilities into NumPy
+                arrays after training and decode with matrix operations.
+                Gives the same tags as the dictionary decoder. Defaults to
+                False.
+            beam_width (Optional[int], optional): only extend the beam_width
+                best states at each position. Beam decoding uses the compiled
+                arrays and is not exact. Defaults to None (no limit).
+            beam_threshold (Optional[float], optional): only extend states
+                whose log probability is within beam_threshold of the best
+                state at each position. Can be combined with beam_width.
+                Defaults to None (no limit).
+            tag_dictionary_min_count (Optional[int], optional): only consider
+                the tags a token had at least this many times in training.
+                Like beam decoding, this uses the compiled arrays. Defaults to
+                None (consider every tag).
+            unknown_tags (str, optional): tags considered for tokens not in
+                the tag dictionary: "all" tags, or only "possible_tag"(token).
+                Defaults to "all".
         """
         super().__init__()
         self.k_transition = k_transition
         self.k_emission = k_emission
         self.extension = extension
+        self.compiled = compiled
+        assert beam_width is None or beam_width >= 1, "beam_width must be at least 1"
+        assert beam_threshold is None or beam_threshold >= 0, "beam_threshold must be non-negative"
+        self.beam_width = beam_width
+        self.beam_threshold = beam_threshold
+        assert unknown_tags in ("all", "possible_tag"), "unknown_tags must be all or possible_tag"
+        self.tag_dictionary_min_count = tag_dictionary_min_count
+        self.unknown_tags = unknown_tags
 
         # you might find these to be useful in your predict_one method
         self._init_log_probs = Counter()
@@ -214,66 +549,571 @@ class HMMPOSTagger(POSTagger):
         # keep track of most uncommon tag
         self.most_uncommon_tag = None
 
-    def train(self, train_data_path: str):
+        # token --> tags it had at least tag_dictionary_min_count times
+        self._tag_dictionary = {}
+
+        # arrays used by the compiled decoder, see _compile
+        self._tag_list = None
+        self._token_index = None
+        self._init_vector = None
+        self._transition_matrix = None
+        self._emission_matrix = None
+        self._candidate_index = None
+
+    def train(self, train_data_path: CorpusSource):
         """
         Train POS tagger, saving initial, transition, and emission
-        probabilities
+        probabilities. The corpus is read lazily in a single pass; an
+        EncodedCorpus is counted and smoothed with NumPy instead (see
+        _train_encoded).
 
         Args:
-            train_data_path (str): path to test data, format should be the
-                format accepted by get_tokens
+            train_data_path (CorpusSource): path to training data, format
+                should be the format accepted by iter_tokens
         """
         super().train(train_data_path)
+        if isinstance(train_data_path, EncodedCorpus):
+            self._train_encoded(train_data_path)
+            if self.compiled or self.is_pruned:
+                self._compile()
+            return
 
         init_counts = Counter()
         transition_counts = defaultdict(Counter)
         emission_counts = defaultdict(Counter)
 
-        sentences = get_tokens(train_data_path)
-        for sentence in sentences:
-            prev_tag = None
-            for token, tag in sentence:
-                if prev_tag is None:
-                    init_counts[tag] += 1
-                else:
-                    transition_counts[prev_tag][tag] += 1
-                emission_counts[tag][token] += 1
-                self._tags.add(tag)
-                prev_tag = tag
-
-        # use laplace smoothing with self.k_transition for initial
-        # probabilities
-        self._init_log_probs = self._smooth_normalize_log(
-            init_counts, self._tags, self.k_transition)
+        with self._phase("count"):
+            for sentence in self._iter_tokens(train_data_path):
+                prev_tag = None
+                for token, tag in sentence:
+                    if prev_tag is None:
+                        init_counts[tag] += 1
+                    else:
+                        transition_counts[prev_tag][tag] += 1
+                    emission_counts[tag][token] += 1
+                    self._tags.add(tag)
+                    prev_tag = tag
+
+        # the probabilities, the most uncommon tag and the tag dictionary
+        with self._phase("smooth"):
+            # use laplace smoothing with self.k_transition for initial
+            # probabilities
+            self._init_log_probs = self._smooth_normalize_log(
+                init_counts, self._tags, self.k_transition)
         
-        # use laplace smoothing with self.k_transition for transition
-        # probabilities
-        for tag, tag_counts in transition_counts.items():
-            self._transition_log_probs[tag] = self._smooth_normalize_log(
-                tag_counts, self._tags, self.k_transition)
-
-        # get tag with most single occurrences
-        most_uncommon_tag = None
-        uncommon_count = 0
-        for tag, tag_counts in emission_counts.items():
-            curr_tag_count = 0
-            for token, count in tag_counts.items():
-                if count == 1:
-                    curr_tag_count += 1
-            if curr_tag_count > uncommon_count:
-                most_uncommon_tag = tag
-                uncommon_count = curr_tag_count
-
-        self.most_uncommon_tag = most_uncommon_tag
+            # use laplace smoothing with self.k_transition for transition
+            # probabilities
+            for tag, tag_counts in transition_counts.items():
+                self._transition_log_probs[tag] = self._smooth_normalize_log(
+                    tag_counts, self._tags, self.k_transition)
+
+            # get tag with most single occurrences
+            most_uncommon_tag = None
+            uncommon_count = 0
+            for tag, tag_counts in emission_counts.items():
+                curr_tag_count = 0
+                for token, count in tag_counts.items():
+                    if count == 1:
+                        curr_tag_count += 1
+                if curr_tag_count > uncommon_count:
+                    most_uncommon_tag = tag
+                    uncommon_count = curr_tag_count
+
+            self.most_uncommon_tag = most_uncommon_tag
                     
 
-        # add <UNK> token with self.k_emission for emission
-        # probabilities
-        for tag, tag_counts in emission_counts.items():
-            vocab = set(tag_counts.keys()) | {UNK_TOKEN}
-            self._emission_log_probs[tag] = self._smooth_normalize_log(
-                tag_counts, vocab, self.k_emission)
+            # add <UNK> token with self.k_emission for emission
+            # probabilities
+            for tag, tag_counts in emission_counts.items():
+                vocab = set(tag_counts.keys()) | {UNK_TOKEN}
+                self._emission_log_probs[tag] = self._smooth_normalize_log(
+                    tag_counts, vocab, self.k_emission)
+
+            if self.tag_dictionary_min_count is not None:
+                tag_dictionary = defaultdict(set)
+                for tag, tag_counts in emission_counts.items():
+                    for token, count in tag_counts.items():
+                        if count >= self.tag_dictionary_min_count:
+                            tag_dictionary[token].add(tag)
+                self._tag_dictionary = dict(tag_dictionary)
+
+        if self.compiled or self.is_pruned:
+            self._compile()
+
+    def _train_encoded(self, corpus: EncodedCorpus):
+        """
+        Train from an integer-encoded corpus: the counts come from
+        np.bincount/np.unique over ID pairs, and add-k smoothing and log
+        normalization are whole-array operations. The log probabilities are
+        stored in the same dictionaries as train fills and match its values
+        (np.log can differ from math.log in the last bit).
+
+        Args:
+            corpus (EncodedCorpus): the training data
+        """
+        num_tags = len(corpus.tag_vocab)
+        num_tokens = len(corpus.token_vocab)
+        tag_ids = np.asarray(corpus.tag_ids, dtype=np.int64)
+        token_ids = np.asarray(corpus.token_ids, dtype=np.int64)
+        starts, ends = corpus.offsets[:-1], corpus.offsets[1:]
+        starts = starts[starts < ends]
+        self._tags.update(corpus.tag_vocab)
+
+        with self._phase("count"):
+            # initial counts from the first tag of each sentence, transition
+            # counts from each pair of neighbouring tags in the same sentence
+            init_counts = np.bincount(tag_ids[starts], minlength=num_tags)
+            follows = np.ones(len(tag_ids), dtype=bool)
+            follows[starts] = False
+            transition_counts = np.bincount(tag_ids[np.flatnonzero(follows) - 1] * num_tags + tag_ids[follows],
+                                            minlength=num_tags * num_tags).reshape(num_tags, num_tags)
+
+            # emission counts of the (tag, token) pairs that occur, sorted by tag
+            pairs, pair_counts = np.unique(tag_ids * num_tokens + token_ids, return_counts=True)
+            pair_tags, pair_tokens = np.divmod(pairs, num_tokens)
+            tag_totals = np.bincount(pair_tags, weights=pair_counts, minlength=num_tags)
+            tag_vocab_sizes = np.bincount(pair_tags, minlength=num_tags) + 1  # + <UNK>
+
+        with self._phase("smooth"):
+            k = self.k_transition
+            # with k = 0, a tag that is never followed by a tag has a 0 / 0 row
+            with np.errstate(divide="ignore", invalid="ignore"):
+                init_log_probs = np.log((init_counts + k) / (init_counts.sum() + k * num_tags))
+                transition_totals = transition_counts.sum(axis=1, keepdims=True)
+                transition_log_probs = np.log((transition_counts + k) / (transition_totals + k * num_tags))
+                transition_log_probs[(transition_totals + k * num_tags == 0)[:, 0]] = float("-inf")
+                emission_denominators = tag_totals + self.k_emission * tag_vocab_sizes
+                pair_log_probs = np.log((pair_counts + self.k_emission) / emission_denominators[pair_tags])
+                unk_log_probs = np.log(self.k_emission / emission_denominators)
 
+            self._init_log_probs = dict(zip(corpus.tag_vocab, init_log_probs.tolist()))
+            # like train, only tags that are followed by a tag get transitions
+            for i in np.flatnonzero(transition_totals[:, 0]):
+                self._transition_log_probs[corpus.tag_vocab[i]] = dict(
+                    zip(corpus.tag_vocab, transition_log_probs[i].tolist()))
+            tag_starts = np.searchsorted(pair_tags, np.arange(num_tags + 1)).tolist()
+            pair_tokens, pair_log_probs = pair_tokens.tolist(), pair_log_probs.tolist()
+            for i, tag in enumerate(corpus.tag_vocab):
+                start, end = tag_starts[i], tag_starts[i + 1]
+                emissions = dict(zip([corpus.token_vocab[token] for token in pair_tokens[start:end]],
+                                     pair_log_probs[start:end]))
+                emissions[UNK_TOKEN] = unk_log_probs[i].item()
+                self._emission_log_probs[tag] = emissions
+
+            # the tag with most single occurrences; ties go to the tag seen first
+            singletons = np.bincount(pair_tags[pair_counts == 1], minlength=num_tags)
+            self.most_uncommon_tag = corpus.tag_vocab[singletons.argmax()] if singletons.max(initial=0) > 0 else None
+
+            if self.tag_dictionary_min_count is not None:
+                tag_dictionary = defaultdict(set)
+                for i in np.flatnonzero(pair_counts >= self.tag_dictionary_min_count).tolist():
+                    tag_dictionary[corpus.token_vocab[pair_tokens[i]]].add(corpus.tag_vocab[pair_tags[i]])
+                self._tag_dictionary = dict(tag_dictionary)
+
+    def _compile(self):
+        """
+        Index the log probability dictionaries into arrays for the compiled
+        decoder: an init vector (T), a transition matrix (T x T, previous tag
+        by next tag) and an emission matrix (T x (V + 1)) whose last column
+        holds each tag's <UNK> log probability. Tags are ordered as
+        self._tags iterates, so ties break the same way as in the dictionary
+        decoder. Missing entries are -inf, except missing emissions, which are
+        NaN so that the decoder can apply the <UNK> fallback.
+        """
+        with self._phase("compile"):
+            self._tag_list = list(self._tags)
+            self._token_index = {}
+            for tag in self._tag_list:
+                for token in self._emission_log_probs[tag]:
+                    if token != UNK_TOKEN:
+                        self._token_index.setdefault(token, len(self._token_index))
+
+            num_tags = len(self._tag_list)
+            self._init_vector = np.array(
+                [self._init_log_probs.get(tag, float("-inf")) for tag in self._tag_list])
+            self._transition_matrix = np.full((num_tags, num_tags), float("-inf"))
+            self._emission_matrix = np.full((num_tags, len(self._token_index) + 1), np.nan)
+            for i, tag in enumerate(self._tag_list):
+                transitions = self._transition_log_probs.get(tag, {})
+                for j, next_tag in enumerate(self._tag_list):
+                    self._transition_matrix[i, j] = transitions.get(next_tag, float("-inf"))
+                for token, log_prob in self._emission_log_probs[tag].items():
+                    if token == UNK_TOKEN:
+                        self._emission_matrix[i, -1] = log_prob
+                    else:
+                        self._emission_matrix[i, self._token_index[token]] = log_prob
+
+            # candidate tag indices of each token in the tag dictionary, in tag order
+            tag_index = {tag: i for i, tag in enumerate(self._tag_list)}
+            self._candidate_index = {
+                token: np.array(sorted(tag_index[tag] for tag in tags), dtype=np.intp)
+                for token, tags in self._tag_dictionary.items()}
+
+    def _emission_lattice(self, sentences: List[List[str]]) -> np.ndarray:
+        """
+        Get the emission log probabilities of sentences for the compiled
+        decoder, filling in missing (tag, token) pairs the same way
+        predict_one does: with the tag's own <UNK> value for the first token
+        and with the <UNK> value of the last tag in self._tags for the rest,
+        or with the <UNK> value of possible_tag(token) if self.extension.
+        The token <UNK> itself has each tag's own <UNK> value, if it has one.
+
+        Args:
+            sentences (List[List[str]]): a list of token lists
+
+        Returns:
+            np.ndarray: len(sentences) x (longest length) x T log
+                probabilities, zero past the end of each sentence
+        """
+        unk_column = self._emission_matrix.shape[1] - 1
+        lengths = [len(tokens) for tokens in sentences]
+        ids = np.full((len(sentences), max(lengths)), unk_column, dtype=np.intp)
+        # a literal <UNK> token is scored with each tag's own <UNK> entry
+        literal_unk = np.zeros(ids.shape, dtype=bool)
+        for row, tokens in enumerate(sentences):
+            ids[row, :len(tokens)] = [self._token_index.get(token, unk_column) for token in tokens]
+            if UNK_TOKEN in tokens:
+                literal_unk[row, :len(tokens)] = [token == UNK_TOKEN for token in tokens]
+        emissions = np.moveaxis(self._emission_matrix[:, ids], 0, -1)
+        # other tokens mapped to the <UNK> column are replaced by the fallback
+        emissions[(ids == unk_column) & ~literal_unk] = np.nan
+
+        missing = np.isnan(emissions)
+        unk_vector = self._emission_matrix[:, -1]
+        if self.extension:
+            for row, i in zip(*np.nonzero(missing.any(axis=2))):
+                if i < lengths[row]:
+                    emissions[row, i, missing[row, i]] = self._unk_log_prob(
+                        self.possible_tag(sentences[row][i]))
+        else:
+            emissions[:, 1:] = np.where(missing[:, 1:], unk_vector[-1], emissions[:, 1:])
+            emissions[:, 0] = np.where(missing[:, 0], unk_vector, emissions[:, 0])
+
+        for row, length in enumerate(lengths):
+            emissions[row, length:] = 0
+        return emissions
+
+    def _unk_log_prob(self, tag: str) -> float:
+        """
+        Args:
+            tag (str): a tag
+
+        Returns:
+            float: the <UNK> emission log probability of the tag (NaN if it
+                has none)
+        """
+        if tag not in self._tags:
+            return np.nan
+        return self._emission_matrix[self._tag_list.index(tag), -1]
+
+    def _predict_one_compiled(self, tokens: List[str]) -> List[str]:
+        """
+        Viterbi over the compiled arrays: each step is a broadcast max/argmax
+        over the T x T (previous tag, tag) scores
+
+        Args:
+            tokens (List[str]): a list of tokens
+
+        Returns:
+            List[str]: tags for each token
+        """
+        emissions = self._emission_lattice([tokens])[0]
+        transitions = self._transition_matrix
+        backpointer = np.zeros((len(tokens), len(self._tag_list)), dtype=np.intp)
+        viterbi = self._init_vector + emissions[0]
+        for i in range(1, len(tokens)):
+            scores = viterbi[:, np.newaxis] + transitions
+            # argmax returns the first maximum, like the strict > in predict_one
+            backpointer[i] = scores.argmax(axis=0)
+            viterbi = scores.max(axis=0) + emissions[i]
+
+        best = int(viterbi.argmax())
+        path = [best]
+        backpointer = backpointer.tolist()
+        for i in range(len(tokens) - 1, 0, -1):
+            best = backpointer[i][best]
+            path.append(best)
+        path.reverse()
+        return [self._tag_list[i] for i in path]
+
+    def _beam(self) -> bool:
+        """
+        Returns:
+            bool: whether decoding is beam pruned
+        """
+        return self.beam_width is not None or self.beam_threshold is not None
+
+    @property
+    def is_pruned(self) -> bool:
+        """
+        Returns:
+            bool: whether decoding is beam pruned and/or restricted by the tag
+                dictionary (see _predict_batch_compiled and beam_report)
+        """
+        return self._beam() or self.tag_dictionary_min_count is not None
+
+    def _restricts_candidates(self) -> bool:
+        """
+        Returns:
+            bool: whether _candidates leaves out tags for some tokens
+        """
+        return self.tag_dictionary_min_count is not None or self.unknown_tags == "possible_tag"
+
+    def _prune(self, viterbi: np.ndarray, keep: np.ndarray) -> np.ndarray:
+        """
+        Select the states to extend at the next position, for a batch
+
+        Args:
+            viterbi (np.ndarray): batch x T log probabilities of the states
+            keep (np.ndarray): batch x T mask of the states that can be kept
+
+        Returns:
+            np.ndarray: batch x T mask of the kept states
+        """
+        if self.beam_threshold is not None:
+            best = np.where(keep, viterbi, float("-inf")).max(axis=1, keepdims=True)
+            keep = keep & (viterbi >= best - self.beam_threshold)
+        if self.beam_width is not None:
+            # states that can be kept first, best first; lexsort is stable, so
+            # the earlier tag wins among equal scores
+            ranked = np.lexsort((-viterbi, ~keep), axis=1)
+            top = np.zeros_like(keep)
+            np.put_along_axis(top, ranked[:, :self.beam_width], True, axis=1)
+            keep = keep & top
+        return keep
+
+    def _candidates(self, token: str) -> np.ndarray:
+        """
+        Args:
+            token (str): a token
+
+        Returns:
+            np.ndarray: indices of the tags considered for the token, in tag
+                order: its tags in the tag dictionary or, for other tokens,
+                possible_tag(token) if self.unknown_tags == "possible_tag"
+                (and it is a known tag) or else every tag
+        """
+        if token in self._candidate_index:
+            return self._candidate_index[token]
+        if self.unknown_tags == "possible_tag":
+            tag = self.possible_tag(token)
+            if tag in self._tags:
+                return np.array([self._tag_list.index(tag)])
+        return np.arange(len(self._tag_list))
+
+    def _candidate_lattice(self, sentences: List[List[str]]) -> np.ndarray:
+        """
+        Args:
+            sentences (List[List[str]]): a list of token lists
+
+        Returns:
+            np.ndarray: len(sentences) x (longest length) x T mask of the
+                candidate tags of each token (see _candidates), False past
+                the end of each sentence
+        """
+        token_ids = {}
+        ids = np.full((len(sentences), max(len(tokens) for tokens in sentences)), -1, dtype=np.intp)
+        for row, tokens in enumerate(sentences):
+            ids[row, :len(tokens)] = [token_ids.setdefault(token, len(token_ids)) for token in tokens]
+        # one mask per distinct token, and an empty one (-1) for the padding
+        masks = np.zeros((len(token_ids) + 1, len(self._tag_list)), dtype=bool)
+        for token, i in token_ids.items():
+            masks[i, self._candidates(token)] = True
+        return masks[ids]
+
+    def beam_report(self, test_data_path: CorpusSource) -> Dict[str, Any]:
+        """
+        Compare pruned decoding (beam and/or tag dictionary) with exact
+        Viterbi on a held out set
+
+        Args:
+            test_data_path (CorpusSource): path to test data, format should
+                be the format accepted by iter_tokens
+
+        Returns:
+            Dict[str, Any]: number of sentences and tokens, the fraction of
+                sentences and of tags where the pruned ("beam") and exact
+                paths differ, the accuracy and decoding time (seconds, in
+                predict_batch's batches) of each, and the lattice cells and
+                states each evaluated
+        """
+        self.check_trained()
+        assert self.is_pruned, "Set beam_width, beam_threshold and/or tag_dictionary_min_count first"
+        sentences = get_tokens(test_data_path)
+        token_lists = [[token for token, _ in sentence] for sentence in sentences]
+
+        result = Counter()
+        exact_paths = [[] for _ in sentences]
+        beam_paths = [[] for _ in sentences]
+        # both decoders get the same length batches as predict_batch
+        for batch in self._length_batches(token_lists, BATCH_SIZE):
+            batch_tokens = [token_lists[i] for i in batch]
+            start = time.perf_counter()
+            paths, cells, states = self._predict_batch_compiled(batch_tokens)
+            result["exact_seconds"] += time.perf_counter() - start
+            result["exact_cells"] += cells
+            result["exact_states"] += states
+            for i, path in zip(batch, paths):
+                exact_paths[i] = [self._tag_list[tag] for tag in path]
+
+            start = time.perf_counter()
+            paths, cells, states = self._predict_batch_compiled(batch_tokens, pruned=True)
+            result["beam_seconds"] += time.perf_counter() - start
+            result["beam_cells"] += cells
+            result["beam_states"] += states
+            for i, path in zip(batch, paths):
+                beam_paths[i] = [self._tag_list[tag] for tag in path]
+
+        for sentence, exact_tags, beam_tags in zip(sentences, exact_paths, beam_paths):
+            golden_tags = [tag for _, tag in sentence]
+            result["sentences"] += 1
+            result["tokens"] += len(sentence)
+            result["different_sentences"] += exact_tags != beam_tags
+            result["different_tags"] += sum(1 for exact, beam in zip(exact_tags, beam_tags) if exact != beam)
+            result["exact_correct"] += sum(1 for gold, exact in zip(golden_tags, exact_tags) if gold == exact)
+            result["beam_correct"] += sum(1 for gold, beam in zip(golden_tags, beam_tags) if gold == beam)
+
+        return {
+            "beam_width": self.beam_width,
+            "beam_threshold": self.beam_threshold,
+            "tag_dictionary_min_count": self.tag_dictionary_min_count,
+            "sentences": result["sentences"],
+            "tokens": result["tokens"],
+            "sentence_disagreement": result["different_sentences"] / result["sentences"],
+            "tag_disagreement": result["different_tags"] / result["tokens"],
+            "exact_accuracy": result["exact_correct"] / result["tokens"],
+            "beam_accuracy": result["beam_correct"] / result["tokens"],
+            "exact_seconds": result["exact_seconds"],
+            "beam_seconds": result["beam_seconds"],
+            "exact_cells": result["exact_cells"],
+            "beam_cells": result["beam_cells"],
+            "exact_states": result["exact_states"],
+            "beam_states": result["beam_states"],
+        }
+
+    def predict_batch(self, sentences: List[List[str]],
+                      batch_size: int = BATCH_SIZE) -> List[List[str]]:
+        """
+        Predict tag sequences for many sentences. With self.compiled or
+        self.is_pruned, sentences are sorted by length and decoded batch_size at a
+        time on a (batch, T) lattice; shorter sentences in a batch are padded
+        and masked out once they end. Gives the same tags as predict_one.
+
+        Args:
+            sentences (List[List[str]]): a list of token lists
+            batch_size (int, optional): number of sentences decoded together.
+                Defaults to BATCH_SIZE.
+
+        Returns:
+            List[List[str]]: tags for each token of each sentence
+        """
+        if not (self.compiled or self.is_pruned):
+            return super().predict_batch(sentences, batch_size)
+
+        predictions = [[] for _ in sentences]
+        for batch in self._length_batches(sentences, batch_size):
+            batch_start = time.perf_counter()
+            paths, cells, _ = self._predict_batch_compiled([sentences[i] for i in batch], self.is_pruned)
+            self._count_cells(cells)
+            for i, path in zip(batch, paths):
+                predictions[i] = [self._tag_list[tag] for tag in path]
+            if self.stats is not None:
+                self.stats.record_decode([len(sentences[i]) for i in batch], time.perf_counter() - batch_start)
+        return predictions
+
+    @staticmethod
+    def _length_batches(sentences: List[List[str]], batch_size: int) -> Iterator[List[int]]:
+        """
+        Args:
+            sentences (List[List[str]]): a list of token lists
+            batch_size (int): number of sentences per batch
+
+        Yields:
+            List[int]: indices of up to batch_size non-empty sentences, in
+                length order
+        """
+        # length buckets: neighbours in length order need little padding
+        order = sorted((i for i, tokens in enumerate(sentences) if tokens),
+                       key=lambda i: len(sentences[i]))
+        for start in range(0, len(order), batch_size):
+            yield order[start:start + batch_size]
+
+    def _predict_batch_compiled(self, sentences: List[List[str]], pruned: bool = False) \
+            -> Tuple[List[List[int]], int, int]:
+        """
+        Batched Viterbi over the compiled arrays. If pruned, each position
+        only has the token's candidate states (see _candidates), the others
+        being masked to -inf, and of those only the states kept by _prune are
+        extended: the others are masked to -inf too or, when the kept states
+        are at most half of the tags, the kept ones are gathered into a
+        (batch, kept, T) lattice instead of a (batch, T, T) one.
+
+        Args:
+            sentences (List[List[str]]): non-empty token lists
+            pruned (bool, optional): restrict the lattice to the candidate
+                states and beam prune it. Defaults to False.
+
+        Returns:
+            Tuple[List[List[int]], int, int]: tag indices (into
+                self._tag_list) for each sentence, the number of lattice cells
+                (previous state, state) evaluated and the number of states
+                visited
+        """
+        num_tags = len(self._tag_list)
+        lengths = np.array([len(tokens) for tokens in sentences])
+        max_length = lengths.max()
+        rows = np.arange(len(sentences))
+        tags = np.arange(num_tags)
+
+        # batch x position x tag
+        emissions = self._emission_lattice(sentences)
+        # the padding is computed too, but not counted
+        cells = 0 if pruned else int((lengths - 1).sum()) * num_tags * num_tags
+        states = int(lengths.sum()) * num_tags
+        candidates = None
+        if pruned and self._restricts_candidates():
+            candidates = self._candidate_lattice(sentences)
+            states = int(np.count_nonzero(candidates))
+
+        backpointer = np.zeros((max_length, len(sentences), num_tags), dtype=np.intp)
+        viterbi = self._init_vector + emissions[:, 0]
+        if candidates is not None:
+            viterbi = np.where(candidates[:, 0], viterbi, float("-inf"))
+        for i in range(1, max_length):
+            active = (i < lengths)[:, np.newaxis]
+            if pruned:
+                kept = candidates[:, i - 1] if candidates is not None else np.ones(viterbi.shape, dtype=bool)
+                if self._beam():
+                    kept = self._prune(viterbi, kept)
+                num_kept = kept.sum(axis=1)
+                num_candidates = candidates[:, i].sum(axis=1) if candidates is not None else num_tags
+                cells += int((num_kept * num_candidates)[active[:, 0]].sum())
+                width = int(num_kept.max())
+            if pruned and 2 * width <= num_tags:
+                # batch x kept tag (in tag order, padded with -inf) x tag
+                kept_tags = np.argsort(~kept, axis=1, kind="stable")[:, :width]
+                previous = np.where(np.take_along_axis(kept, kept_tags, axis=1),
+                                    np.take_along_axis(viterbi, kept_tags, axis=1), float("-inf"))
+                scores = previous[:, :, np.newaxis] + self._transition_matrix[kept_tags]
+                best = np.take_along_axis(kept_tags, scores.argmax(axis=1), axis=1)
+            else:
+                previous = np.where(kept, viterbi, float("-inf")) if pruned else viterbi
+                # batch x previous tag x tag
+                scores = previous[:, :, np.newaxis] + self._transition_matrix
+                best = scores.argmax(axis=1)
+            # sentences that have ended keep their scores and point to the
+            # same tag, so that the backtrace passes through the padding
+            backpointer[i] = np.where(active, best, tags)
+            next_viterbi = scores.max(axis=1) + emissions[:, i]
+            if candidates is not None:
+                next_viterbi = np.where(candidates[:, i], next_viterbi, float("-inf"))
+            viterbi = np.where(active, next_viterbi, viterbi)
+
+        paths = np.zeros((len(sentences), max_length), dtype=np.intp)
+        paths[:, -1] = viterbi.argmax(axis=1)
+        for i in range(max_length - 1, 0, -1):
+            paths[:, i - 1] = backpointer[i, rows, paths[:, i]]
+        return [path[:length] for path, length in zip(paths.tolist(), lengths.tolist())], cells, states
 
     def predict_one(self, tokens: List[str]):
         """
@@ -286,6 +1126,14 @@ class HMMPOSTagger(POSTagger):
         Returns:
             List[str]: tags for each token
         """
+        if self.is_pruned:
+            (path,), cells, _ = self._predict_batch_compiled([tokens], pruned=True)
+            self._count_cells(cells)
+            return [self._tag_list[tag] for tag in path]
+        self._count_cells((len(tokens) - 1) * len(self._tags) ** 2)
+        if self.compiled:
+            return self._predict_one_compiled(tokens)
+
         # raise NotImplementedError("You need to implement this method")
         # Initialize the viterbi matrix and backpointer matrix
         viterbi = defaultdict(list)
@@ -337,6 +1185,88 @@ class HMMPOSTagger(POSTagger):
 
         return bestPath
     
+    def _is_loaded(self) -> bool:
+        """
+        Returns:
+            bool: True if the tagger only has the arrays read by load
+        """
+        return not self._emission_log_probs and self._emission_matrix is not None
+
+    def save(self, path: str, dtype: str = "float64"):
+        """
+        Save the trained tagger to a single binary file: the compiled arrays
+        (init vector, transition matrix and emission matrix, see _compile),
+        the tag dictionary as candidate tag indices per token, and a JSON
+        header with the tag index, token index and settings
+
+        Args:
+            path (str): the file path
+            dtype (str, optional): "float32" or "float64", the precision of the
+                stored log probabilities. Defaults to "float64".
+        """
+        assert self._tags, "Must train (or set_model_params) before saving"
+        if not self._is_loaded():
+            self._compile()
+        tokens = list(self._token_index)
+        candidates = [self._candidate_index.get(token, np.zeros(0, dtype=np.intp)) for token in tokens]
+        save_arrays(path, {
+            "format": type(self).__name__,
+            "version": MODEL_FORMAT_VERSION,
+            "k_transition": self.k_transition,
+            "k_emission": self.k_emission,
+            "extension": self.extension,
+            "beam_width": self.beam_width,
+            "beam_threshold": self.beam_threshold,
+            "tag_dictionary_min_count": self.tag_dictionary_min_count,
+            "unknown_tags": self.unknown_tags,
+            "most_uncommon_tag": self.most_uncommon_tag,
+            "tags": self._tag_list,
+            "tokens": tokens,
+        }, {
+            "init": self._init_vector.astype(dtype),
+            "transition": self._transition_matrix.astype(dtype),
+            "emission": self._emission_matrix.astype(dtype),
+            "candidate_offsets": np.cumsum([0] + [len(tags) for tags in candidates], dtype=np.int64),
+            "candidate_tags": np.concatenate([np.zeros(0, dtype=np.int32)] + candidates).astype(np.int32),
+        })
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "HMMPOSTagger":
+        """
+        Load a tagger written by save. The loaded tagger decodes with the
+        compiled arrays; it can be trained again but not changed with
+        set_model_params' dictionaries. With mmap, processes loading the same
+        file (or forked from one that did) share the arrays. predict's
+        workers are forked where possible; a spawned worker (e.g. on
+        Windows) receives a pickled copy of the arrays instead.
+
+        Args:
+            path (str): the file path
+            mmap (bool, optional): memory map the arrays. Defaults to True.
+
+        Returns:
+            HMMPOSTagger: the loaded tagger
+        """
+        metadata, arrays = _load_tagger_arrays(cls, path, mmap)
+        tagger = cls(k_transition=metadata["k_transition"], k_emission=metadata["k_emission"],
+                     extension=metadata["extension"], compiled=True, beam_width=metadata["beam_width"],
+                     beam_threshold=metadata["beam_threshold"],
+                     tag_dictionary_min_count=metadata["tag_dictionary_min_count"],
+                     unknown_tags=metadata["unknown_tags"])
+        tagger.most_uncommon_tag = metadata["most_uncommon_tag"]
+        tagger._tag_list = metadata["tags"]
+        tagger._tags = set(tagger._tag_list)
+        tagger._token_index = {token: i for i, token in enumerate(metadata["tokens"])}
+        tagger._init_vector = arrays["init"]
+        tagger._transition_matrix = arrays["transition"]
+        tagger._emission_matrix = arrays["emission"]
+
+        candidates = np.split(np.asarray(arrays["candidate_tags"], dtype=np.intp),
+                              np.asarray(arrays["candidate_offsets"][1:-1]))
+        tagger._candidate_index = {token: tags for token, tags in zip(metadata["tokens"], candidates) if len(tags)}
+        tagger._trained = True
+        return tagger
+
     def possible_tag(self, token: str) -> str:
         """
         Get possible tags for an unknown token
@@ -378,6 +1308,16 @@ class HMMPOSTagger(POSTagger):
         self._init_log_probs = init
         self._emission_log_probs = emission
         self._transition_log_probs = transition
+        if self.tag_dictionary_min_count is not None:
+            # without counts, every token with a possible emission is allowed
+            tag_dictionary = defaultdict(set)
+            for tag, tag_emissions in emission.items():
+                for token, log_prob in tag_emissions.items():
+                    if token != UNK_TOKEN and log_prob > float("-inf"):
+                        tag_dictionary[token].add(tag)
+            self._tag_dictionary = dict(tag_dictionary)
+        if self.compiled or self.is_pruned:
+            self._compile()
 
     @staticmethod
     def _smooth_normalize_log(counts: Dict[str, int], vocab: Set[str], k: float) \
@@ -1,4 +1,6 @@
 import argparse
+import json
+from corpus import load_corpus
 from model import BaselinePOSTagger, HMMPOSTagger
 
 
@@ -15,20 +17,124 @@ def main():
         "test_file_path",
         type=str,
         help="The file to use for testing")
+    parser.add_argument(
+        "--compiled",
+        action="store_true",
+        help="Decode the HMM with the compiled NumPy Viterbi")
+    parser.add_argument(
+        "--n_jobs",
+        default=1,
+        type=int,
+        help="Number of worker processes used to tag the test set (-1 for all cores)")
+    parser.add_argument(
+        "--beam_width",
+        type=int,
+        help="Decode the HMM with a beam of this many states per position")
+    parser.add_argument(
+        "--beam_threshold",
+        type=float,
+        help="Decode the HMM keeping only states within this log probability of the best")
+    parser.add_argument(
+        "--tag_dictionary_min_count",
+        type=int,
+        help="Only consider the tags a token had at least this many times in training")
+    parser.add_argument(
+        "--unknown_tags",
+        default="all",
+        choices=["all", "possible_tag"],
+        help="Tags considered for tokens not in the tag dictionary")
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Read the files through binary caches (built next to them on the first run)")
+    parser.add_argument(
+        "--save_models",
+        type=str,
+        help="Save the trained taggers to PREFIX.baseline.bin and PREFIX.hmm.bin")
+    parser.add_argument(
+        "--load_models",
+        type=str,
+        help="Load taggers saved with --save_models PREFIX instead of training them "
+             "(train_file_path and the HMM options are ignored)")
+    parser.add_argument(
+        "--error_index",
+        action="store_true",
+        help="Also save an index of the incorrect predictions by (actual, predicted) tag, "
+             "used by error_helper.py --golden/--predicted")
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print per-phase timings, decoding throughput and latency for each tagger")
+    parser.add_argument(
+        "--stats_json",
+        type=str,
+        help="Save the --stats of both taggers to this JSON file")
     args = parser.parse_args()
+    instrument = args.stats or args.stats_json is not None
+    stats = {}
+
+    train_data, test_data = args.train_file_path, args.test_file_path
+    if args.cache:
+        test_data = load_corpus(test_data)
+        if args.load_models is None:
+            train_data = load_corpus(train_data)
 
     print("Baseline")
     print("--------------")
-    tagger = BaselinePOSTagger()
-    tagger.train(args.train_file_path)
-    tagger.predict(args.test_file_path)
+    if args.load_models is not None:
+        tagger = BaselinePOSTagger.load(f"{args.load_models}.baseline.bin")
+    else:
+        tagger = BaselinePOSTagger()
+    if instrument:
+        tagger.instrument()
+    if args.load_models is None:
+        tagger.train(train_data)
+    if args.save_models is not None:
+        tagger.save(f"{args.save_models}.baseline.bin")
+    tagger.predict(test_data, n_jobs=args.n_jobs, error_index=args.error_index)
+    if instrument:
+        stats["baseline"] = tagger.stats.as_dict()
+    if args.stats:
+        print(tagger.stats.summary())
     print("\n\n")
 
     print("Hidden Markov Model")
     print("--------------")
-    tagger = HMMPOSTagger()
-    tagger.train(args.train_file_path)
-    tagger.predict(args.test_file_path)
+    if args.load_models is not None:
+        tagger = HMMPOSTagger.load(f"{args.load_models}.hmm.bin")
+    else:
+        tagger = HMMPOSTagger(compiled=args.compiled, beam_width=args.beam_width,
+                              beam_threshold=args.beam_threshold,
+                              tag_dictionary_min_count=args.tag_dictionary_min_count,
+                              unknown_tags=args.unknown_tags)
+    if instrument:
+        tagger.instrument()
+    if args.load_models is None:
+        tagger.train(train_data)
+    if args.save_models is not None:
+        tagger.save(f"{args.save_models}.hmm.bin")
+    tagger.predict(test_data, n_jobs=args.n_jobs, error_index=args.error_index)
+    if instrument:
+        stats["hmm"] = tagger.stats.as_dict()
+    if args.stats:
+        print(tagger.stats.summary())
+    if args.stats_json is not None:
+        with open(args.stats_json, "w") as f:
+            json.dump(stats, f, indent=2)
+
+    if tagger.is_pruned:
+        report = tagger.beam_report(test_data)
+        print()
+        print("Pruned (beam) vs exact Viterbi")
+        print("Sentences that differ: {0:.2%}".format(report["sentence_disagreement"]))
+        print("Tags that differ: {0:.2%}".format(report["tag_disagreement"]))
+        print("Accuracy: {0:.2%} (beam) vs {1:.2%} (exact)".format(
+            report["beam_accuracy"], report["exact_accuracy"]))
+        print("Lattice cells: {0} (beam) vs {1} (exact)".format(report["beam_cells"], report["exact_cells"]))
+        print("States per position: {0:.2f} (beam) vs {1:.2f} (exact)".format(
+            report["beam_states"] / report["tokens"], report["exact_states"] / report["tokens"]))
+        print("Decoding time: {0:.3f}s (beam) vs {1:.3f}s (exact)".format(
+            report["beam_seconds"], report["exact_seconds"]))
 
 
 if __name__ == "__main__":
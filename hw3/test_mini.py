@@ -62,6 +62,22 @@ def main():
     predictions = tagger.predict_one(["ski", "on", "snow"])
     print("Should be N P N:", predictions)
 
+    print("Example 3: 'ski <UNK> snow', with the dictionary and compiled decoders")
+    # each tag has its own <UNK> emission, which a literal <UNK> token should use
+    emission_3 = {tag: dict(emissions) for tag, emissions in emission_2.items()}
+    emission_3["V"]["<UNK>"] = -1
+    emission_3["N"]["<UNK>"] = -9
+    emission_3["P"]["<UNK>"] = -9
+    tokens = ["ski", "<UNK>", "snow"]
+    tagger.set_model_params(init_2, transition_2, emission_3)
+    dict_predictions = tagger.predict_one(tokens)
+    compiled_tagger = HMMPOSTagger(k_emission=0, k_transition=0, compiled=True)
+    compiled_tagger.set_model_params(init_2, transition_2, emission_3)
+    compiled_predictions = compiled_tagger.predict_one(tokens)
+    print("Should be N V N:", dict_predictions)
+    print("Should be True:", dict_predictions == compiled_predictions
+          == compiled_tagger.predict_batch([tokens])[0])
+
 
 if __name__ == "__main__":
     main()